@@ -1,11 +1,28 @@
 import numpy as np
 import cv2 as cv
 import glob
+import hashlib
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-def undistort_image(img, data_path: str):
+# inner corners of the chessboard (columns, rows)
+BOARD_SIZE = (10, 7)
+SQUARE_SIZE = 1 # mm
+CACHE_DIR_NAME = ".calibration_cache"
 
-    ret, mtx, dist, rvecs, tvecs = calibrate(data_path=data_path)
+
+def undistort_image(img, data_path: str | None = None, intrinsics: tuple | None = None):
+    """
+    Undistorts an image with the camera's intrinsics.
+
+    Either pass data_path (folder of calibration images, see calibrate) or precomputed intrinsics (mtx, dist)
+    so the same calibration can be reused for many images.
+    """
+    if intrinsics is None:
+        ret, mtx, dist, rvecs, tvecs = calibrate(data_path=data_path)
+    else:
+        mtx, dist = intrinsics
 
     h,  w = img.shape[:2]
     
@@ -26,41 +43,329 @@ def undistort_image(img, data_path: str):
 
     return dst
 
-def calibrate(data_path: str) -> np.ndarray | bool:
+class Undistorter:
+    """
+    Undistorts a stream of frames from one camera. The undistortion maps are computed once per resolution with
+    cv.initUndistortRectifyMap (restricted to the valid ROI, so no crop is needed) and every frame costs one cv.remap.
+    Produces the same output as undistort_image.
+    """
+    def __init__(self, mtx: np.ndarray, dist: np.ndarray, fixed_point: bool = True):
+        """
+        mtx, dist: intrinsics from calibrate
+        fixed_point: store the maps as CV_16SC2 fixed point maps (faster remap, half the memory)
+        """
+        self.mtx = mtx
+        self.dist = dist
+        self.fixed_point = fixed_point
+        self.maps = {}  # (w, h) -> (map1, map2)
+
+    @classmethod
+    def from_calibration(cls, data_path: str, **kwargs):
+        """Builds an Undistorter from a folder of calibration images (see calibrate)"""
+        ret, mtx, dist, rvecs, tvecs = calibrate(data_path=data_path)
+        return cls(mtx, dist, **kwargs)
+
+    def get_maps(self, image_size: tuple) -> tuple[np.ndarray, np.ndarray]:
+        """Returns (and caches) the remap tables for a (w, h) input resolution"""
+        if image_size not in self.maps:
+            newcameramtx, roi = cv.getOptimalNewCameraMatrix(self.mtx, self.dist, image_size, 0, image_size)
+            m1type = cv.CV_16SC2 if self.fixed_point else cv.CV_32FC1
+            map1, map2 = cv.initUndistortRectifyMap(self.mtx, self.dist, None, newcameramtx, image_size, m1type)
+
+            # only keep the valid region, that is what undistort_image crops to
+            x, y, w, h = roi
+            map1 = np.ascontiguousarray(map1[y:y+h, x:x+w])
+            map2 = np.ascontiguousarray(map2[y:y+h, x:x+w])
+            self.maps[image_size] = (map1, map2)
+        return self.maps[image_size]
+
+    def __call__(self, img: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        img: distorted frame
+        out: optional preallocated output (ROI sized, same dtype/channels as img), reused across frames
+        """
+        h, w = img.shape[:2]
+        map1, map2 = self.get_maps((w, h))
+        return cv.remap(img, map1, map2, cv.INTER_LINEAR, dst=out)
+
+
+def distorted_coordinates(mtx: np.ndarray, dist: np.ndarray, image_size: tuple, points: np.ndarray) -> np.ndarray:
+    """
+    Inverse of undistort_image for coordinates: maps pixels of the undistorted (ROI cropped) image back to the raw
+    camera image, so the distortion can be folded into other remap tables.
+
+    image_size: (w, h) of the raw camera image
+    points: (..., 2) pixel coordinates in the image returned by undistort_image
+
+    Output: (..., 2) float32 pixel coordinates in the raw image
+    """
+    newcameramtx, roi = cv.getOptimalNewCameraMatrix(mtx, dist, image_size, 0, image_size)
+    x, y, _, _ = roi
+
+    # back project through the undistorted camera onto the z = 1 plane, then project with the distortion model
+    pts = points.reshape(-1, 2).astype(np.float64) + (x, y)
+    rays = np.column_stack(((pts - newcameramtx[:2, 2]) @ np.linalg.inv(newcameramtx[:2, :2]).T, np.ones(len(pts))))
+    distorted, _ = cv.projectPoints(rays.reshape(-1, 1, 3), np.zeros(3), np.zeros(3), mtx, dist)
+
+    return distorted.reshape(points.shape).astype(np.float32)
+
+
+def _file_digest(fname: str) -> str:
+    with open(fname, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _calibration_key(digests: list[str], detect_scale: float = 1.0, max_views: int | None = None) -> str:
+    """Content hash of the calibration image set and the board/detection/selection parameters"""
+    h = hashlib.sha256(repr((BOARD_SIZE, SQUARE_SIZE, detect_scale, max_views)).encode())
+    for digest in sorted(digests):
+        h.update(digest.encode())
+    return h.hexdigest()
 
-    if not os.path.exists(data_path):
-        return False
-    data_path = os.path.join(data_path, "*.jpg")
 
-    SQUARE_SIZE = 1 # mm
+def _corner_store_path(cache_dir: str, digest: str, detect_scale: float = 1.0) -> str:
+    """Corner store entry of one image, keyed by the image's content hash and the board/detection parameters"""
+    key = hashlib.sha256(repr((digest, BOARD_SIZE, detect_scale)).encode()).hexdigest()
+    return os.path.join(cache_dir, "corners", key + ".npz")
+
+
+def _load_stored_corners(path: str):
+    with np.load(path) as data:
+        corners = data["corners"] if data["found"] else None
+        return corners, tuple(int(x) for x in data["image_size"])
+
+
+def _save_stored_corners(path: str, corners, image_size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    found = corners is not None
+    np.savez(path, found=found, corners=corners if found else np.zeros((0, 1, 2), np.float32), image_size=image_size)
+
+
+def _load_cached_calibration(cache_path: str):
+    with np.load(cache_path) as data:
+        return float(data["ret"]), data["mtx"], data["dist"], tuple(data["rvecs"]), tuple(data["tvecs"])
+
+
+def _save_cached_calibration(cache_path: str, ret, mtx, dist, rvecs, tvecs):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    np.savez(cache_path, ret=ret, mtx=mtx, dist=dist, rvecs=np.array(rvecs), tvecs=np.array(tvecs))
+
+
+def _detect_corners(fname: str, detect_scale: float = 1.0):
+    """
+    Finds and subpixel refines the chessboard corners of one image. Module level so it can run in a process pool.
+
+    With detect_scale < 1 the (slow) board search runs on a downscaled copy and only cornerSubPix runs at full resolution.
+
+    Output: (corners or None if the board was not found, (w, h) image size)
+    """
     # termination criteria
     criteria = (cv.TERM_CRITERIA_EPS + cv.TERM_CRITERIA_MAX_ITER, 30, 0.001)
 
+    gray = cv.imread(fname, cv.IMREAD_GRAYSCALE)
+    image_size = gray.shape[::-1]
+
+    if detect_scale < 1:
+        small = cv.resize(gray, None, fx=detect_scale, fy=detect_scale, interpolation=cv.INTER_AREA)
+        ret, corners = cv.findChessboardCorners(small, BOARD_SIZE, None)
+        if ret:
+            corners = corners / detect_scale
+    else:
+        ret, corners = cv.findChessboardCorners(gray, BOARD_SIZE, None)
+
+    if not ret:
+        return None, image_size
+
+    corners = cv.cornerSubPix(gray, corners, (11,11), (-1,-1), criteria)
+    return corners, image_size
+
+
+def _detect_all_corners(images: list[str], digests: list[str], cache_dir: str, use_cache: bool = True,
+                        workers: int | None = None, detect_scale: float = 1.0) -> list:
+    """
+    Corners of every image, in order. With use_cache, images whose corners are already in the corner store are
+    not re-detected, only new or changed images go through the process pool (and are then added to the store).
+    """
+    detections = [None] * len(images)
+    missing = []
+    for i, digest in enumerate(digests):
+        path = _corner_store_path(cache_dir, digest, detect_scale)
+        if use_cache and os.path.exists(path):
+            detections[i] = _load_stored_corners(path)
+        else:
+            missing.append(i)
+
+    fnames = [images[i] for i in missing]
+    if workers == 1 or len(fnames) <= 1:
+        found = [_detect_corners(fname, detect_scale) for fname in fnames]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            found = list(pool.map(_detect_corners, fnames, [detect_scale] * len(fnames)))
+
+    for i, detection in zip(missing, found):
+        detections[i] = detection
+        if use_cache:
+            _save_stored_corners(_corner_store_path(cache_dir, digests[i], detect_scale), *detection)
+
+    return detections
+
+
+def _board_object_points() -> np.ndarray:
     # prepare object points, like (0,0,0), (1,0,0), (2,0,0) ....,(6,5,0)
-    objp = np.zeros((10*7,3), np.float32)
-    objp[:,:2] = np.mgrid[0:10,0:7].T.reshape(-1,2) # * SQUARE_SIZE
+    objp = np.zeros((BOARD_SIZE[0]*BOARD_SIZE[1],3), np.float32)
+    objp[:,:2] = np.mgrid[0:BOARD_SIZE[0],0:BOARD_SIZE[1]].T.reshape(-1,2) # * SQUARE_SIZE
+    return objp
+
+
+def select_views(imgpoints: list, image_size: tuple, max_views: int, grid: tuple = (8, 8)) -> list[int]:
+    """
+    Greedily picks a small, well conditioned subset of calibration views.
+
+    Every view is described by its 4 outer board corners normalized by the image size (captures position, scale,
+    in plane rotation and tilt of the board) and by the cells of a coarse image grid its board covers. Each step
+    adds the view with the most newly covered cells plus the largest distance to the closest already selected
+    view, so near duplicates are skipped and the corners spread over the whole image (needed for distortion).
+
+    imgpoints: detected corners of every view (as passed to cv.calibrateCamera)
+    image_size: (w, h)
+    max_views: number of views to keep
+    grid: (columns, rows) of the coverage grid
+
+    Output: indices of the selected views, in selection order
+    """
+    n_views = len(imgpoints)
+    if n_views <= max_views:
+        return list(range(n_views))
+
+    w, h = image_size
+    outer = [0, BOARD_SIZE[0] - 1, -1, -BOARD_SIZE[0]]  # board corners in polygon order
+    quads = np.stack([corners.reshape(-1, 2)[outer] for corners in imgpoints]) / (w, h)
+    features = quads.reshape(n_views, -1)
+
+    coverage = np.zeros((n_views, grid[1], grid[0]), np.uint8)
+    for i, quad in enumerate(quads):
+        cv.fillConvexPoly(coverage[i], np.round(quad * grid - 0.5).astype(np.int32), 1)
+    coverage = coverage.reshape(n_views, -1).astype(bool)
+
+    selected = []
+    covered = np.zeros(coverage.shape[1], bool)
+    diversity = np.zeros(n_views)
+    available = np.ones(n_views, bool)
+    for _ in range(max_views):
+        gain = (coverage & ~covered).sum(axis=1) / coverage.shape[1]
+        score = np.where(available, gain + diversity, -np.inf)
+        best = int(score.argmax())
+
+        selected.append(best)
+        available[best] = False
+        covered |= coverage[best]
+        dist = np.linalg.norm(features - features[best], axis=1)
+        diversity = dist if len(selected) == 1 else np.minimum(diversity, dist)
+
+    return selected
+
+
+def _rms_reprojection_error(objpoints: list, imgpoints: list, mtx: np.ndarray, dist: np.ndarray) -> float:
+    """RMS reprojection error of fixed intrinsics over the given views (the board pose of every view is re-solved)"""
+    sq_err = 0
+    n_points = 0
+    for objp, corners in zip(objpoints, imgpoints):
+        _, rvec, tvec = cv.solvePnP(objp, corners, mtx, dist)
+        projected, _ = cv.projectPoints(objp, rvec, tvec, mtx, dist)
+        sq_err += np.sum((projected.reshape(-1, 2) - corners.reshape(-1, 2)) ** 2)
+        n_points += len(objp)
+    return float(np.sqrt(sq_err / n_points))
+
+
+def compare_view_selection(data_path: str, max_views: int, use_cache: bool = True, workers: int | None = None,
+                           detect_scale: float = 1.0) -> dict:
+    """
+    Calibrates with every view and with the select_views subset and reports the solve time of both and the RMS
+    reprojection error of both calibrations, evaluated over every view.
+    """
+    cache_dir = os.path.join(data_path, CACHE_DIR_NAME)
+    images = glob.glob(os.path.join(data_path, "*.jpg"))
+    digests = [_file_digest(fname) for fname in images]
+    detections = _detect_all_corners(images, digests, cache_dir, use_cache, workers, detect_scale)
+
+    imgpoints = [corners for corners, _ in detections if corners is not None]
+    objpoints = [_board_object_points()] * len(imgpoints)
+    image_size = detections[0][1]
+
+    start = time.perf_counter()
+    _, mtx_all, dist_all, _, _ = cv.calibrateCamera(objpoints, imgpoints, image_size, None, None)
+    time_all = time.perf_counter() - start
+
+    start = time.perf_counter()
+    subset = select_views(imgpoints, image_size, max_views)
+    _, mtx_sub, dist_sub, _, _ = cv.calibrateCamera([objpoints[i] for i in subset], [imgpoints[i] for i in subset],
+                                                    image_size, None, None)
+    time_subset = time.perf_counter() - start
+
+    report = {
+        "n_views": len(imgpoints),
+        "n_selected": len(subset),
+        "time_all": time_all,
+        "time_subset": time_subset,
+        "speedup": time_all / time_subset,
+        "rms_all": _rms_reprojection_error(objpoints, imgpoints, mtx_all, dist_all),
+        "rms_subset": _rms_reprojection_error(objpoints, imgpoints, mtx_sub, dist_sub),
+    }
+    print(f"{report['n_selected']}/{report['n_views']} views: solve {report['time_all']:.3f}s -> "
+          f"{report['time_subset']:.3f}s ({report['speedup']:.1f}x), "
+          f"RMS reprojection error {report['rms_all']:.4f} -> {report['rms_subset']:.4f} px")
+    return report
+
+
+def calibrate(data_path: str, use_cache: bool = True, workers: int | None = None,
+              detect_scale: float = 1.0, max_views: int | None = None) -> tuple | bool:
+    """
+    Zhang calibration from the chessboard images (*.jpg) in data_path.
+
+    The result is cached on disk in data_path/.calibration_cache, keyed by a content hash of the images and the
+    board parameters, so later runs on an unchanged image set skip corner detection and the solve entirely.
+    The detected corners of every image are also stored (keyed by the image's hash), so after adding or changing a
+    few images only those are re-detected before the solve.
+    Corner detection runs in a process pool (workers=None uses every core, workers=1 runs serially).
+    detect_scale < 1 searches for the board on a downscaled copy and refines the corners at full resolution.
+    max_views solves with only that many views picked by select_views (rvecs/tvecs then belong to those views),
+    see compare_view_selection for the effect on solve time and reprojection error.
+
+    Output: (ret, mtx, dist, rvecs, tvecs) like cv.calibrateCamera, or False if data_path does not exist
+    """
+    if not os.path.exists(data_path):
+        return False
+    cache_dir = os.path.join(data_path, CACHE_DIR_NAME)
+    data_path = os.path.join(data_path, "*.jpg")
+    images = glob.glob(data_path)
+    digests = [_file_digest(fname) for fname in images]
+
+    if use_cache:
+        cache_path = os.path.join(cache_dir, _calibration_key(digests, detect_scale, max_views) + ".npz")
+        if os.path.exists(cache_path):
+            return _load_cached_calibration(cache_path)
+
+    objp = _board_object_points()
     # Arrays to store object points and image points from all the images.
     objpoints = [] # 3d point in real world space
     imgpoints = [] # 2d points in image plane.
-    images = glob.glob(data_path)
-    # print(images)
-    for fname in images:
-        img = cv.imread(fname)
-        gray = cv.cvtColor(img, cv.COLOR_BGR2GRAY)
-        # Find the chess board corners
-        ret, corners = cv.findChessboardCorners(gray, (10,7), None)
-        # If found, add object points, image points (after refining them)
-        if ret == True:
+
+    detections = _detect_all_corners(images, digests, cache_dir, use_cache, workers, detect_scale)
+
+    for corners, image_size in detections:
+        # If found, add object points, image points
+        if corners is not None:
             objpoints.append(objp)
-            corners2 = cv.cornerSubPix(gray,corners, (11,11), (-1,-1), criteria)
-            imgpoints.append(corners2)
-            # Draw and display the corners
-            cv.drawChessboardCorners(img, (10,7), corners2, ret)
-            # cv.imshow('img', img)
-            # cv.waitKey(500)
+            imgpoints.append(corners)
+
+    if max_views is not None:
+        subset = select_views(imgpoints, image_size, max_views)
+        objpoints = [objpoints[i] for i in subset]
+        imgpoints = [imgpoints[i] for i in subset]
 
-    cv.destroyAllWindows()
+    ret, mtx, dist, rvecs, tvecs = cv.calibrateCamera(objpoints, imgpoints, image_size, None, None)
 
-    ret, mtx, dist, rvecs, tvecs = cv.calibrateCamera(objpoints, imgpoints, gray.shape[::-1], None, None)
+    if use_cache:
+        _save_cached_calibration(cache_path, ret, mtx, dist, rvecs, tvecs)
 
-    return ret, mtx, dist, rvecs, tvecs
\ No newline at end of file
+    return ret, mtx, dist, rvecs, tvecs
@@ -1,8 +1,8 @@
 import numpy as np
 import cv2
-from helper import plotMatches
+from helper import PATCHWIDTH, computeBrief, plotMatches, popcount
 from matchPics import matchPics
-from calibration import undistort_image
+from calibration import Undistorter, calibrate, distorted_coordinates
 
 
 class Border:
@@ -46,22 +46,8 @@ def pad_and_concat(im1: np.ndarray, im2: np.ndarray) -> np.ndarray:
     return np.hstack((im1, im2))
     
 
-def fuse_two_frames(im_one_path: str, im_two_path: str, im_one_calib_path: str, im_two_calib_path: str) -> np.ndarray:
-    """ takes two images (left, and right) and homographically projects the right image onto the left.
-
-    Inputs:
-    im_one_path str: path to the left image (should end in '.jpg')
-    im_two_path str: path to the right image (should end in '.jpg')
-    im_one_calib_path str: path to the folder of calibration images for the left camera (should end in path_to_folder/)
-    im_two_calib_path str: path to the folder of calibration images for the right camera (should end in path_to_folder/)
-
-    Output:
-    warped_cover np.ndarray: overlapping projected image
-    """
-
-    left = undistort_image(cv2.imread(im_one_path), im_one_calib_path)
-    right = undistort_image(cv2.imread(im_two_path), im_two_calib_path)
-
+def select_borders(left: np.ndarray, right: np.ndarray) -> tuple[int, int]:
+    """Shows both images and returns the clicked (left, right) x coordinates where the overlapping region starts/ends"""
     left_border = Border()
     right_border = Border()
 
@@ -73,36 +59,387 @@ def fuse_two_frames(im_one_path: str, im_two_path: str, im_one_calib_path: str,
     cv2.waitKey(0)
     cv2.destroyAllWindows()
 
-    # Crops the image based on clicks in previous code
-    left[:, :left_border.border] = [0, 0, 0]
-    right[:, right_border.border:] = [0, 0, 0]
-    # Displays cropped image
-    cv2.imshow("Cropped Images", pad_and_concat(left, right))
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+    return left_border.border, right_border.border
+
+
+def warped_corners(H: np.ndarray, shape: tuple) -> np.ndarray:
+    """(4, 2) corners of an image of the given (h, w, ...) shape after the homography H"""
+    h, w = shape[:2]
+    corners = np.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=np.float64).reshape(-1, 1, 2)
+    return cv2.perspectiveTransform(corners, H).reshape(-1, 2)
+
 
-    # Extracts features in the overlapping region and maps them
-    matches, locs1, locs2 = matchPics(left, right)
+def canvas_bounds(Hs: list[np.ndarray], shapes: list[tuple]) -> tuple[tuple[int, int], tuple[int, int]]:
+    """
+    Tight canvas around several images, each warped into a common reference frame by its homography.
+
+    Output:
+    offset (x, y): where the reference frame's origin lands on the canvas (the translation applied on top of every H)
+    canvas_size (w, h): size of the bounding box of all images
+    """
+    corners = np.vstack([warped_corners(H, shape) for H, shape in zip(Hs, shapes)])
+    x0, y0 = np.floor(corners.min(axis=0)).astype(int)
+    x1, y1 = np.ceil(corners.max(axis=0)).astype(int)
+    return (int(-x0), int(-y0)), (int(x1 - x0), int(y1 - y0))
+
+
+def canvas_geometry(H: np.ndarray, left_shape: tuple, right_shape: tuple) -> tuple[tuple[int, int], tuple[int, int]]:
+    """Tight canvas around the left image and the right image warped by H, see canvas_bounds"""
+    return canvas_bounds([np.eye(3), H], [left_shape, right_shape])
+
+
+def _window_match(grey_one: np.ndarray, grey_two: np.ndarray, pts_two: np.ndarray, H: np.ndarray,
+                  radius: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds every img_two point in img_one by comparing its BRIEF descriptor with the descriptors of all pixels in a
+    (2 radius + 1)^2 window around the position H predicts, no corner detection needed.
 
+    pts_two: (N, 2) (x, y) points in grey_two
+
+    output pts_one: (K, 2) (x, y) best match in grey_one of every kept point
+    output keep: (N,) points whose patch and search window fit inside the images
+    """
+    half = PATCHWIDTH // 2
+    p2 = np.rint(pts_two).astype(int)
+    pred = np.rint(cv2.perspectiveTransform(pts_two.reshape(-1, 1, 2).astype(np.float64), H)[:, 0]).astype(int)
+
+    (h1, w1), (h2, w2) = grey_one.shape, grey_two.shape
+    keep = ((p2 >= half) & (p2 < (w2 - half, h2 - half))).all(axis=1)
+    keep &= ((pred >= half + radius) & (pred < (w1 - half - radius, h1 - half - radius))).all(axis=1)
+
+    # (row, col) keypoints, all inside the images so computeBrief keeps every one of them in order
+    desc2, _ = computeBrief(grey_two, np.fliplr(p2[keep]))
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    offsets = np.column_stack((dy.ravel(), dx.ravel()))
+    candidates = (np.fliplr(pred[keep])[:, None, :] + offsets).reshape(-1, 2)
+    desc1, _ = computeBrief(grey_one, candidates)
+
+    dist = popcount(desc1.reshape(desc2.shape[0], offsets.shape[0], -1) ^ desc2[:, None, :])
+    best = candidates.reshape(desc2.shape[0], offsets.shape[0], 2)[np.arange(desc2.shape[0]), dist.argmin(axis=1)]
+    return np.fliplr(best).astype(np.float64), keep
+
+
+def _fit_homography(src: np.ndarray, dst: np.ndarray) -> tuple[np.ndarray | None, np.ndarray | None]:
+    """RANSAC homography taking src to dst, (None, None) when there are too few points or RANSAC fails"""
+    if len(src) < 4:
+        return None, None
+    return cv2.findHomography(src, dst, method=cv2.RANSAC)
+
+
+def estimate_homography(img_one: np.ndarray, img_two: np.ndarray, roi_one: tuple | None = None,
+                        roi_two: tuple | None = None, levels: int = 1, radius: int = 4) -> np.ndarray:
+    """
+    Matches BRIEF features between two (undistorted) images and returns the RANSAC homography taking img_two to img_one
+
+    roi_one, roi_two: optional (x0, y0, x1, y1) region of each image to look for features in, e.g. the overlap
+    levels: pyramid levels. With levels > 1 features are only detected and matched on the image downsampled by
+        2^(levels-1), every finer level then relocates the coarse inliers inside a small window around the position
+        the previous H predicts and re-fits H, so FAST never runs on the full resolution frames
+    radius: half size of the search window at the finer levels, in pixels of that level
+    """
+    pyramid_one, pyramid_two = [img_one], [img_two]
+    for _ in range(levels - 1):
+        pyramid_one.append(cv2.pyrDown(pyramid_one[-1]))
+        pyramid_two.append(cv2.pyrDown(pyramid_two[-1]))
+    scale = 2 ** (levels - 1)
+    if roi_one is not None:
+        roi_one = tuple(v // scale for v in roi_one)
+    if roi_two is not None:
+        roi_two = tuple(v // scale for v in roi_two)
+
+    # Extracts features and maps them
+    matches, locs1, locs2 = matchPics(pyramid_one[-1], pyramid_two[-1], roi1=roi_one, roi2=roi_two)
 
     x1 = np.fliplr(locs1[matches[:, 0]])
     x2 = np.fliplr(locs2[matches[:, 1]])
 
-    # plotMatches(left, right, matches, locs1, locs2)
+    # plotMatches(img_one, img_two, matches, locs1, locs2)
+
+    H, inliers = _fit_homography(x2, x1)
+    if H is None:
+        raise ValueError(f"no homography found at pyramid level {levels - 1} (downsampled {scale}x) from "
+                         f"{len(x1)} matches, try fewer levels or a larger overlap")
+
+    # coarse to fine: the inliers of the previous level are relocated with H as the prior
+    up = np.diag([2.0, 2.0, 1.0])
+    for level in range(levels - 2, -1, -1):
+        H = up @ H @ np.linalg.inv(up)
+        x2 = x2[inliers.ravel() > 0] * 2
+        x1, keep = _window_match(cv2.cvtColor(pyramid_one[level], cv2.COLOR_BGR2GRAY),
+                                 cv2.cvtColor(pyramid_two[level], cv2.COLOR_BGR2GRAY), x2, H, radius)
+        x2 = x2[keep]
+        refined, refined_inliers = _fit_homography(x2, x1)
+        if refined is None:
+            # keep the coarser estimate, scaled up to full resolution
+            print(f"refinement failed at pyramid level {level} ({len(x1)} points), using the level {level + 1} homography")
+            H = np.linalg.matrix_power(up, level) @ H @ np.linalg.matrix_power(np.linalg.inv(up), level)
+            break
+        H, inliers = refined, refined_inliers
 
-    # Find homography matrix that takes right image to left
-    H, _ = cv2.findHomography(x2, x1, method=cv2.RANSAC)
     print(H)
+    return H
+
+
+class FrameFusion:
+    """
+    Stores everything needed to stitch a left/right camera pair: both cameras' intrinsics, the homography that takes
+    the (undistorted) right image into the left image, the overlap borders and the canvas geometry.
+    The canvas is the tight bounding box of both images, the left image sits at offset on it.
+
+    FrameFusion.fit does the one time work (borders, feature matching and RANSAC) and save/load persist the result,
+    so calling a fitted FrameFusion on new frames is headless: undistort, warp and paste, no GUI or feature matching.
+    """
+    def __init__(self, H: np.ndarray, borders: tuple[int, int], canvas_size: tuple[int, int],
+                 left_intrinsics: tuple, right_intrinsics: tuple, offset: tuple[int, int] = (0, 0),
+                 undistorters: tuple[Undistorter, Undistorter] | None = None):
+        """
+        H: (3, 3) homography taking the undistorted right image into the left image
+        borders: (left, right) x coordinates of the overlapping region
+        canvas_size: (w, h) of the stitched image
+        left_intrinsics, right_intrinsics: (mtx, dist) of each camera, see calibrate
+        offset: (x, y) position of the left image on the canvas
+        undistorters: optional (left, right) Undistorters of these intrinsics to reuse, e.g. the ones fit already
+            built its undistortion maps with
+        """
+        self.H = H
+        self.borders = borders
+        self.canvas_size = canvas_size
+        self.offset = offset
+        # takes the undistorted right image onto the canvas
+        self.canvas_H = np.array([[1, 0, offset[0]], [0, 1, offset[1]], [0, 0, 1]]) @ H
+        self.left_intrinsics = left_intrinsics
+        self.right_intrinsics = right_intrinsics
+        if undistorters is None:
+            undistorters = (Undistorter(*left_intrinsics), Undistorter(*right_intrinsics))
+        self.left_undistorter, self.right_undistorter = undistorters
+
+    @classmethod
+    def fit(cls, left_img: np.ndarray, right_img: np.ndarray, left_intrinsics: tuple, right_intrinsics: tuple,
+            borders: tuple[int, int] | None = None, show: bool = False, levels: int = 1):
+        """
+        Estimates the homography between a pair of (distorted) frames.
+
+        borders: (left, right) overlap borders. None asks for them with two mouse clicks
+        show: display the overlap regions used for matching
+        levels: pyramid levels of the coarse to fine homography estimation, see estimate_homography
+        """
+        left_undistorter = Undistorter(*left_intrinsics)
+        right_undistorter = Undistorter(*right_intrinsics)
+        left = left_undistorter(left_img)
+        right = right_undistorter(right_img)
+
+        if borders is None:
+            borders = select_borders(left, right)
+        left_border, right_border = borders
+
+        # Features are only detected inside the overlapping region of each image
+        left_roi = (left_border, 0, left.shape[1], left.shape[0])
+        right_roi = (0, 0, right_border, right.shape[0])
+        if show:
+            # Displays the overlap regions
+            cv2.imshow("Cropped Images", pad_and_concat(left[:, left_border:], right[:, :right_border]))
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+
+        # Find homography matrix that takes right image to left from features in the overlapping region
+        H = estimate_homography(left, right, left_roi, right_roi, levels=levels)
+
+        offset, canvas_size = canvas_geometry(H, left.shape, right.shape)
+
+        # the undistorters (and their maps for these frame sizes) are handed over instead of being rebuilt
+        return cls(H, borders, canvas_size, left_intrinsics, right_intrinsics, offset,
+                   (left_undistorter, right_undistorter))
+
+    def save(self, path: str):
+        np.savez(path, H=self.H, borders=np.array(self.borders), canvas_size=np.array(self.canvas_size),
+                 offset=np.array(self.offset),
+                 left_mtx=self.left_intrinsics[0], left_dist=self.left_intrinsics[1],
+                 right_mtx=self.right_intrinsics[0], right_dist=self.right_intrinsics[1])
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(data["H"], tuple(int(x) for x in data["borders"]), tuple(int(x) for x in data["canvas_size"]),
+                       (data["left_mtx"], data["left_dist"]), (data["right_mtx"], data["right_dist"]),
+                       tuple(int(x) for x in data["offset"]))
+
+    def __call__(self, left_img: np.ndarray, right_img: np.ndarray, feather: bool = False) -> np.ndarray:
+        """
+        Stitches a (distorted) frame pair with the stored homography.
+
+        Only the bounding box of the warped right image is warped. With feather the seam is blended linearly across
+        the overlap strip (the columns of the left image that the right image also reaches), everything else is a paste.
+        """
+        left = self.left_undistorter(left_img)
+        right = self.right_undistorter(right_img)
+        w, h = self.canvas_size
+        ox, oy = self.offset
+        lh, lw = left.shape[:2]
+
+        warped_cover = np.zeros((h, w) + right.shape[2:], dtype=right.dtype)
+
+        # Takes the right image and transforms it via H into left space, only inside its bounding box
+        corners = warped_corners(self.canvas_H, right.shape)
+        x0, y0 = np.maximum(np.floor(corners.min(axis=0)).astype(int), 0)
+        x1, y1 = np.minimum(np.ceil(corners.max(axis=0)).astype(int), (w, h))
+        to_box = np.array([[1, 0, -x0], [0, 1, -y0], [0, 0, 1]]) @ self.canvas_H
+        warped_cover[y0:y1, x0:x1] = cv2.warpPerspective(right, to_box, (x1 - x0, y1 - y0))
+
+        # overlap strip in canvas columns: from the leftmost warped right pixel to the end of the left image
+        s0, s1 = max(x0, ox), ox + lw
+        if feather and s0 < s1:
+            right_strip = warped_cover[oy:oy+lh, s0:s1].astype(np.float32)
+            to_strip = np.array([[1, 0, -s0], [0, 1, -oy], [0, 0, 1]]) @ self.canvas_H
+            valid = cv2.warpPerspective(np.ones(right.shape[:2], np.uint8), to_strip, (s1 - s0, lh),
+                                        flags=cv2.INTER_NEAREST)
+
+            # weight of the right image ramps from 0 to 1 across the strip, where it has pixels
+            alpha = np.linspace(0, 1, s1 - s0, dtype=np.float32)[None, :] * valid
+            alpha = alpha[..., None]
+
+        # Paste the images together
+        warped_cover[oy:oy+lh, ox:ox+lw] = left
+
+        if feather and s0 < s1:
+            left_strip = left[:, s0-ox:].astype(np.float32)
+            warped_cover[oy:oy+lh, s0:s1] = (left_strip * (1 - alpha) + right_strip * alpha).astype(left.dtype)
+
+        return warped_cover
+
+
+# remap coordinate for canvas pixels that no source pixel lands on
+OUTSIDE = -10000
+
+
+def _pixel_grid(w: int, h: int, x0: int = 0, y0: int = 0) -> np.ndarray:
+    """(h, w, 2) float32 (u, v) coordinates of the pixels of a box starting at (x0, y0)"""
+    u, v = np.meshgrid(np.arange(x0, x0 + w, dtype=np.float32), np.arange(y0, y0 + h, dtype=np.float32))
+    return np.dstack((u, v))
+
+
+def canvas_map(intrinsics: tuple, raw_size: tuple[int, int], undistorted_size: tuple[int, int], H: np.ndarray,
+               box: tuple[int, int, int, int]) -> np.ndarray:
+    """
+    Remap table that takes a raw (distorted) camera frame straight onto a box of the canvas.
+
+    canvas pixel -> undistorted pixel through H^-1 -> raw pixel through the distortion model
+
+    intrinsics: (mtx, dist) of the camera
+    raw_size: (w, h) of the raw camera frames
+    undistorted_size: (w, h) of the undistorted (ROI cropped) frames, see Undistorter.get_maps
+    H: homography taking the undistorted frame onto the canvas
+    box: (x0, y0, x1, y1) canvas region the table covers
+
+    Output: (y1 - y0, x1 - x0, 2) float32 map, canvas pixels the camera does not see are set to OUTSIDE
+    """
+    x0, y0, x1, y1 = box
+    w, h = x1 - x0, y1 - y0
+    canvas = _pixel_grid(w, h, x0, y0).reshape(-1, 1, 2)
+    pts = cv2.perspectiveTransform(canvas, np.linalg.inv(H)).reshape(h, w, 2)
+
+    # pixels outside the undistorted image stay black, like with warpPerspective. They point far outside of
+    # the source (not just off the edge) so remap takes its fast all-border path instead of blending the border
+    outside = np.any((pts < 0) | (pts > np.array(undistorted_size) - 1), axis=2)
+    coords = distorted_coordinates(*intrinsics, raw_size, pts)
+    coords[outside] = OUTSIDE
+    return coords
+
+
+class RemapStitcher:
+    """
+    Stitches frame pairs with exactly one cv.remap per camera.
+
+    The undistortion of each camera and the homography are composed into one precomputed remap table per camera
+    that targets the final canvas directly, instead of undistort + warpPerspective + paste (three full image
+    resampling passes). Both cameras are remapped straight into a preallocated canvas, the tables are float maps
+    unless fixed_point is set.
+    """
+    def __init__(self, fusion: FrameFusion, left_size: tuple[int, int], right_size: tuple[int, int],
+                 fixed_point: bool = False):
+        """
+        fusion: fitted (or loaded) FrameFusion
+        left_size, right_size: (w, h) of the raw left and right camera frames
+        fixed_point: store the tables as CV_16SC2 fixed point maps (half the memory). Float CV_32FC2 maps measured
+            faster for canvas sized tables, so they are the default
+        """
+        self.fixed_point = fixed_point
+        self.canvas_size = fusion.canvas_size
+        w, h = self.canvas_size
+
+        # the left image is pasted untransformed at the offset, with the size undistort_image crops it to
+        left_w, left_h = fusion.left_undistorter.get_maps(left_size)[0].shape[1::-1]
+        ox, oy = fusion.offset
+        self.left_box = (oy, min(oy + left_h, h), ox, min(ox + left_w, w))
+        y0, y1, x0, x1 = self.left_box
+        self.left_maps = self._convert_maps(distorted_coordinates(
+            *fusion.left_intrinsics, left_size, _pixel_grid(x1 - x0, y1 - y0)))
+
+        right_roi = fusion.right_undistorter.get_maps(right_size)[0].shape[1::-1]
+        right_map = canvas_map(fusion.right_intrinsics, right_size, right_roi, fusion.canvas_H, (0, 0, w, h))
+        # the left image covers its region anyway, skip sampling the right image there
+        right_map[y0:y1, x0:x1] = OUTSIDE
+        self.right_maps = self._convert_maps(right_map)
+
+        self.canvas = None
+
+    def _convert_maps(self, coords: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        coords = np.ascontiguousarray(coords)
+        if self.fixed_point:
+            return cv2.convertMaps(coords, None, cv2.CV_16SC2)
+        return coords, None
+
+    def __call__(self, left_img: np.ndarray, right_img: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Stitches a (distorted) frame pair.
+
+        out: optional (h, w, 3) canvas to write into. Without it an internal canvas is reused, which is overwritten by
+            the next call (copy it if it needs to outlive the frame)
+        """
+        if out is None:
+            if self.canvas is None:
+                self.canvas = np.empty((self.canvas_size[1], self.canvas_size[0], 3), dtype=left_img.dtype)
+            out = self.canvas
+
+        cv2.remap(right_img, *self.right_maps, cv2.INTER_LINEAR, dst=out, borderMode=cv2.BORDER_CONSTANT)
+
+        # the left image is remapped straight into its block of the canvas
+        y0, y1, x0, x1 = self.left_box
+        cv2.remap(left_img, *self.left_maps, cv2.INTER_LINEAR, dst=out[y0:y1, x0:x1])
+
+        return out
+
+
+def fuse_two_frames(im_one_path: str, im_two_path: str, im_one_calib_path: str, im_two_calib_path: str,
+                    fusion_path: str | None = None, feather: bool = False, levels: int = 1) -> np.ndarray:
+    """ takes two images (left, and right) and homographically projects the right image onto the left.
+
+    Inputs:
+    im_one_path str: path to the left image (should end in '.jpg')
+    im_two_path str: path to the right image (should end in '.jpg')
+    im_one_calib_path str: path to the folder of calibration images for the left camera (should end in path_to_folder/)
+    im_two_calib_path str: path to the folder of calibration images for the right camera (should end in path_to_folder/)
+    fusion_path str: optional path (.npz) to save the fitted FrameFusion to, so later frames can be stitched headless
+        with FrameFusion.load(fusion_path)(left, right)
+    feather bool: blend the seam across the overlap strip instead of pasting the left image over the right
+    levels int: pyramid levels for the homography estimation, 1 matches at full resolution, 2 or 3 fit much faster
+        on high resolution frames
+
+    Output:
+    warped_cover np.ndarray: overlapping projected image
+    """
+
+    # calibrate each camera once (cached on disk) and reuse the intrinsics for every undistortion
+    left_intrinsics = calibrate(im_one_calib_path)[1:3]
+    right_intrinsics = calibrate(im_two_calib_path)[1:3]
 
-    left = undistort_image(cv2.imread(im_one_path), im_one_calib_path)
-    right = undistort_image(cv2.imread(im_two_path), im_two_calib_path)
+    left_img = cv2.imread(im_one_path)
+    right_img = cv2.imread(im_two_path)
 
-    # Takes the right image and transforms it via H into left space (modifies "right" variable)
-    # The shape is larger as the warped image's size increases
-    warped_cover = cv2.warpPerspective(right, H, (2*right.shape[1], right.shape[0] + 1000))
+    fusion = FrameFusion.fit(left_img, right_img, left_intrinsics, right_intrinsics, show=True, levels=levels)
+    if fusion_path is not None:
+        fusion.save(fusion_path)
 
-    # Paste the images together
-    warped_cover[0:right.shape[0], 0:right.shape[1]] = left
+    warped_cover = fusion(left_img, right_img, feather=feather)
 
     # Display the final result
     cv2.imwrite("homography_result.jpg", warped_cover)
@@ -6,13 +6,187 @@ import skimage.feature
 
 PATCHWIDTH = 9
 
+# number of set bits of every byte value
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# bytes of temporaries briefMatch may use per block of desc1 rows, the block height is derived from it and M
+MATCH_BUDGET = 32 << 20
+# bytes per compared pair held at once: the uint64 XOR word and its bit count, the uint16 distance and its partition
+MATCH_PAIR_BYTES = 20
+
+
+def popcount(x):
+	# sums the set bits over the last axis of an unsigned integer array
+	if hasattr(np, "bitwise_count"):
+		return np.bitwise_count(x).sum(axis=-1, dtype=np.uint16)
+	return POPCOUNT_TABLE[x.view(np.uint8)].sum(axis=-1, dtype=np.uint16)
+
+
+def hammingDistance(desc1, desc2):
+	# (N, M) Hamming distances between packed binary descriptors (rows of uint8 bytes) via XOR + popcount
+	# descriptors whose length is a multiple of 8 bytes are compared as uint64 words
+	# the counts are accumulated one word at a time, so temporaries stay (N, M) instead of (N, M, words)
+	if desc1.shape[1] % 8 == 0:
+		desc1 = np.ascontiguousarray(desc1).view(np.uint64)
+		desc2 = np.ascontiguousarray(desc2).view(np.uint64)
+	dist = np.zeros((desc1.shape[0], desc2.shape[0]), dtype=np.uint16)
+	for w in range(desc1.shape[1]):
+		dist += popcount((desc1[:, w, None] ^ desc2[None, :, w])[..., None])
+	return dist
+
+
 def briefMatch(desc1,desc2,ratio=0.8):
+	# cross checked nearest neighbour matching of packed BRIEF descriptors with a ratio test
+	# (same semantics as skimage.feature.match_descriptors(desc1, desc2, 'hamming', cross_check=True, max_ratio=ratio))
+	n1, n2 = desc1.shape[0], desc2.shape[0]
+	if n1 == 0 or n2 == 0:
+		return np.zeros((0, 2), dtype=np.intp)
+
+	best1 = np.empty(n1, dtype=np.intp)
+	dist1 = np.empty(n1, dtype=np.uint16)
+	second1 = np.full(n1, np.iinfo(np.uint16).max, dtype=np.uint16)
+	best2 = np.empty(n2, dtype=np.intp)
+	dist2 = np.full(n2, np.iinfo(np.uint16).max, dtype=np.uint16)
+
+	block = max(1, MATCH_BUDGET // (n2 * MATCH_PAIR_BYTES))
+	for start in range(0, n1, block):
+		stop = min(start + block, n1)
+		dist = hammingDistance(desc1[start:stop], desc2)
+		rows = np.arange(stop - start)
 
-	matches = skimage.feature.match_descriptors(desc1,desc2,'hamming',cross_check=True,max_ratio=ratio)
-	return matches
+		best1[start:stop] = dist.argmin(axis=1)
+		dist1[start:stop] = dist[rows, best1[start:stop]]
+		if n2 > 1:
+			second1[start:stop] = np.partition(dist, 1, axis=1)[:, 1]
+
+		# running column minimum for the cross check
+		col = dist.argmin(axis=0)
+		col_dist = dist[col, np.arange(n2)]
+		better = col_dist < dist2
+		best2[better] = col[better] + start
+		dist2[better] = col_dist[better]
+
+	idx1 = np.arange(n1)
+	keep = best2[best1] == idx1
+	if ratio < 1:
+		# a zero second best distance can only pass if the best is zero too, which is ambiguous -> rejected
+		with np.errstate(divide="ignore", invalid="ignore"):
+			keep &= (dist1 / second1.astype(np.float64)) < ratio
+
+	return np.column_stack((idx1[keep], best1[keep]))
+
+
+def nearestNeighbours(desc1, desc2):
+	# exact nearest neighbour (lowest index on ties), its distance and the second best distance in desc2 of every desc1
+	n1, n2 = desc1.shape[0], desc2.shape[0]
+	best = np.empty(n1, dtype=np.intp)
+	best_dist = np.empty(n1, dtype=np.uint16)
+	second = np.full(n1, np.iinfo(np.uint16).max, dtype=np.uint16)
+	block = max(1, MATCH_BUDGET // (max(n2, 1) * MATCH_PAIR_BYTES))
+	for start in range(0, n1, block):
+		stop = min(start + block, n1)
+		dist = hammingDistance(desc1[start:stop], desc2)
+		best[start:stop] = dist.argmin(axis=1)
+		best_dist[start:stop] = dist[np.arange(stop - start), best[start:stop]]
+		if n2 > 1:
+			second[start:stop] = np.partition(dist, 1, axis=1)[:, 1]
+	return best, best_dist, second
 	
 	
 
+class BinaryDescriptorIndex:
+	# multi-index hashing over packed binary descriptors
+	# every descriptor is split into n_substrings substrings, each substring indexes one hash table (a sorted key array).
+	# descriptors that share at least one substring exactly are candidates, by the pigeonhole principle every pair with
+	# a Hamming distance < n_substrings is a candidate. Only candidate pairs get their full distance computed.
+	# match is an approximate matcher: best and second best come from the candidates only, so pairs that are never
+	# proposed are missed and a true second best outside the candidates can let an ambiguous match pass the ratio
+	# test. Use briefMatch where exact brute force semantics matter.
+
+	def __init__(self, desc, n_substrings=16):
+		self.desc = np.ascontiguousarray(desc)
+		self.n_substrings = n_substrings
+		self.tables = [self._table(keys) for keys in self._substrings(self.desc)]
+
+	def _substrings(self, desc):
+		# (n_substrings, N) integer keys, the descriptor bytes are split into n_substrings equal chunks
+		nbytes = desc.shape[1]
+		assert nbytes % self.n_substrings == 0, "descriptor length must be a multiple of n_substrings bytes"
+		chunk = nbytes // self.n_substrings
+		weights = 256 ** np.arange(chunk - 1, -1, -1, dtype=np.int64)
+		return (desc.reshape(desc.shape[0], self.n_substrings, chunk).astype(np.int64) @ weights).T
+
+	@staticmethod
+	def _table(keys):
+		order = np.argsort(keys, kind="stable")
+		unique, start, count = np.unique(keys[order], return_index=True, return_counts=True)
+		return order, unique, start, count
+
+	def candidates(self, query, max_bucket=4096):
+		# (query index, index index) pairs that share at least one substring
+		# buckets where the two sides would produce more than max_bucket pairs (e.g. flat image regions) are skipped
+		pairs = []
+		for keys, (order2, unique2, start2, count2) in zip(self._substrings(query), self.tables):
+			order1, unique1, start1, count1 = self._table(keys)
+			_, i1, i2 = np.intersect1d(unique1, unique2, assume_unique=True, return_indices=True)
+			n1, n2 = count1[i1], count2[i2]
+			ok = n1 * n2 <= max_bucket
+			i1, i2, n1, n2 = i1[ok], i2[ok], n1[ok], n2[ok]
+
+			# cartesian product of every shared bucket without a Python loop
+			sizes = n1 * n2
+			group = np.repeat(np.arange(sizes.shape[0]), sizes)
+			within = np.arange(sizes.sum()) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+			a = order1[start1[i1][group] + within // n2[group]]
+			b = order2[start2[i2][group] + within % n2[group]]
+			pairs.append(a * self.desc.shape[0] + b)
+
+		pairs = np.unique(np.concatenate(pairs))
+		return pairs // self.desc.shape[0], pairs % self.desc.shape[0]
+
+	def match(self, query, ratio=0.8, max_bucket=4096):
+		# approximate cross checked nearest neighbour matching with a ratio test, restricted to candidate pairs
+		# queries with a single candidate get their true second best distance by brute force, without it they
+		# would pass any ratio test
+		# returns (K, 2) matches of (query index, index index), like briefMatch
+		q, d = self.candidates(query, max_bucket)
+		if q.shape[0] == 0:
+			return np.zeros((0, 2), dtype=np.intp)
+		dist = popcount(query[q] ^ self.desc[d])
+
+		# best and second best index descriptor for every query (ties go to the lower index)
+		order = np.lexsort((d, dist, q))
+		q_sorted = q[order]
+		first = np.ones(order.shape[0], dtype=bool)
+		first[1:] = q_sorted[1:] != q_sorted[:-1]
+		best = order[first]
+		second_dist = np.full(best.shape[0], np.iinfo(np.uint16).max, dtype=np.uint16)
+		has_second = np.flatnonzero(first) + 1
+		valid = has_second < order.shape[0]
+		valid[valid] = ~first[has_second[valid]]
+		second_dist[valid] = dist[order[has_second[valid]]]
+		if ratio < 1 and self.desc.shape[0] > 1:
+			lone = np.flatnonzero(~valid)
+			_, lone_best, lone_second = nearestNeighbours(query[q[best[lone]]], self.desc)
+			# the brute force best can only be closer than the candidate, which is then not a true nearest neighbour
+			second_dist[lone] = np.where(lone_best < dist[best[lone]], lone_best, lone_second)
+
+		# best query for every index descriptor, for the cross check
+		order_d = np.lexsort((q, dist, d))
+		d_sorted = d[order_d]
+		first_d = np.ones(order_d.shape[0], dtype=bool)
+		first_d[1:] = d_sorted[1:] != d_sorted[:-1]
+		best_q_of_d = np.full(self.desc.shape[0], -1, dtype=np.intp)
+		best_q_of_d[d_sorted[first_d]] = q[order_d[first_d]]
+
+		keep = best_q_of_d[d[best]] == q[best]
+		if ratio < 1:
+			with np.errstate(divide="ignore", invalid="ignore"):
+				keep &= (dist[best] / second_dist.astype(np.float64)) < ratio
+
+		return np.column_stack((q[best][keep], d[best][keep]))
+
+
 def plotMatches(im1,im2,matches,locs1,locs2):
 	fig, ax = plt.subplots(nrows=1, ncols=1)
 	im1 = cv2.cvtColor(im1, cv2.COLOR_BGR2GRAY)
@@ -25,16 +199,22 @@ def plotMatches(im1,im2,matches,locs1,locs2):
 
 
 def makeTestPattern(patchWidth, nbits):
-	np.random.seed(0)
-	compareX = patchWidth*patchWidth * np.random.random((nbits,1))
+	# private generators, same pattern as seeding the global RNG with 0 and 1 without touching it
+	compareX = patchWidth*patchWidth * np.random.RandomState(0).random_sample((nbits,1))
 	compareX = np.floor(compareX).astype(int)
-	np.random.seed(1)
-	compareY = patchWidth*patchWidth * np.random.random((nbits,1))
+	compareY = patchWidth*patchWidth * np.random.RandomState(1).random_sample((nbits,1))
 	compareY = np.floor(compareY).astype(int)
 
 	return (compareX, compareY)
 
 
+# BRIEF pattern, generated once: (row, col) offset from the keypoint of both pixels of every test
+NBITS = 256
+COMPARE_X, COMPARE_Y = makeTestPattern(PATCHWIDTH, NBITS)
+PATTERN_ROWS = np.stack((COMPARE_X[:, 0] // PATCHWIDTH, COMPARE_Y[:, 0] // PATCHWIDTH)) - PATCHWIDTH // 2
+PATTERN_COLS = np.stack((COMPARE_X[:, 0] % PATCHWIDTH, COMPARE_Y[:, 0] % PATCHWIDTH)) - PATCHWIDTH // 2
+
+
 
 
 def computePixel(img, idx1, idx2, width, center):
@@ -45,7 +225,7 @@ def computePixel(img, idx1, idx2, width, center):
 	row2 = idx2 // width - halfWidth
 	return 1 if img[int(center[0]+row1)][int(center[1]+col1)] < img[int(center[0]+row2)][int(center[1]+col2)] else 0
 
-def computeBrief(img, locs):
+def computeBrief(img, locs, sigma=None):
     
     #patchWidth = 9
     #nbits = 256
@@ -59,36 +239,62 @@ def computeBrief(img, locs):
     #
     #return desc, locs
     
-    patchWidth = 9
-    nbits = 256
-    compareX, compareY = makeTestPattern(patchWidth,nbits)
+    # sigma: optional gaussian smoothing applied once to the whole image before the tests (None compares raw pixels)
     m, n = img.shape
 
-    halfWidth = patchWidth//2
+    halfWidth = PATCHWIDTH//2
 
     part1 = np.logical_and(halfWidth <= locs[:, 0], locs[:, 0] < m-halfWidth)
     part2 = np.logical_and(halfWidth <= locs[:, 1], locs[:, 1] < n-halfWidth)
     locs = locs[np.logical_and(part1, part2), :]
 
-    zipped = np.column_stack((compareX, compareY))
-    col1 = zipped[:, 0] % patchWidth - halfWidth
-    row1 = zipped[:, 0] // patchWidth - halfWidth
-    col2 = zipped[:, 1] % patchWidth - halfWidth
-    row2 = zipped[:, 1] // patchWidth - halfWidth
-    center0_row1 = np.add.outer(locs[:, 0], row1).astype(int)
-    center1_col1 = np.add.outer(locs[:, 1], col1).astype(int)
-    center0_row2 = np.add.outer(locs[:, 0], row2).astype(int)
-    center1_col2 = np.add.outer(locs[:, 1], col2).astype(int)
+    if sigma is not None:
+        img = cv2.GaussianBlur(img, (0, 0), sigma)
+    flat_img = np.ascontiguousarray(img).ravel()
 
-    desc = np.zeros((locs.shape[0], zipped.shape[0]))
-    desc[img[center0_row1, center1_col1] < img[center0_row2, center1_col2]] = 1
+    # flat offsets of the pattern for this image width, each keypoint is then a single gather per test pixel
+    offsets = PATTERN_ROWS * n + PATTERN_COLS
+    centers = (locs[:, 0] * n + locs[:, 1])[:, None]
+
+    # one bit per test, packed into nbits/8 bytes per keypoint (32 bytes instead of 256 float64)
+    desc = np.packbits(flat_img[centers + offsets[0]] < flat_img[centers + offsets[1]], axis=1)
 
     return desc, locs
 
 
 
-def corner_detection(im, sigma=0.15):
+def corner_detection(im, sigma=0.15, grid=None, per_cell=None, budget=None):
 	# fast method
 	result_img = skimage.feature.corner_fast(im, PATCHWIDTH, sigma)
 	locs = skimage.feature.corner_peaks(result_img, min_distance=1)
-	return locs
+	if grid is None and per_cell is None and budget is None:
+		return locs
+	return selectKeypoints(locs, result_img[locs[:, 0], locs[:, 1]], im.shape, grid, per_cell, budget)
+
+
+def selectKeypoints(locs, response, shape, grid=(8, 8), per_cell=None, budget=None):
+	# keeps the per_cell strongest keypoints of every cell of a (columns, rows) grid, then the budget strongest overall
+	# without a grid the whole image is a single cell
+	# spreads the keypoints over the image and bounds descriptor/matching cost
+	# locs: (N, 2) (row, col) keypoints, response: (N,) corner strength, shape: image shape
+	if grid is None:
+		cell = np.zeros(locs.shape[0], dtype=np.int64)
+	else:
+		cols, rows = grid
+		cell_row = locs[:, 0] * rows // shape[0]
+		cell_col = locs[:, 1] * cols // shape[1]
+		cell = cell_row * cols + cell_col
+
+	# strongest first within every cell, rank = position inside its cell
+	order = np.lexsort((-response, cell))
+	keep = order
+	if per_cell is not None:
+		sorted_cell = cell[order]
+		starts = np.flatnonzero(np.r_[True, sorted_cell[1:] != sorted_cell[:-1]])
+		rank = np.arange(order.shape[0]) - np.repeat(starts, np.diff(np.r_[starts, order.shape[0]]))
+		keep = order[rank < per_cell]
+
+	if budget is not None and keep.shape[0] > budget:
+		keep = keep[np.argsort(-response[keep], kind="stable")[:budget]]
+
+	return locs[np.sort(keep)]
@@ -3,12 +3,33 @@
 import numpy as np
 import cv2
 import skimage.color
+from helper import BinaryDescriptorIndex
 from helper import briefMatch
 from helper import computeBrief
 from helper import corner_detection
 
-def matchPics(I1, I2):
+# descriptor pairs (N*M) above which matching uses BinaryDescriptorIndex
+INDEX_MATCH_THRESHOLD = 4_000_000
+
+def cropROI(I, roi):
+	#roi : (x0, y0, x1, y1) box, None is the whole image
+	#returns a view of I inside the box and the (row, col) offset of the view in I
+	if roi is None:
+		return I, np.zeros(2, dtype=int)
+	x0, y0, x1, y1 = roi
+	x0, y0 = max(x0, 0), max(y0, 0)
+	return I[y0:y1, x0:x1], np.array([y0, x0])
+
+def matchPics(I1, I2, grid=None, per_cell=None, budget=None, roi1=None, roi2=None, exact=False):
 	#I1, I2 : Images to match
+	#grid, per_cell, budget : optional keypoint bucketing, see helper.selectKeypoints (None keeps every corner)
+	#roi1, roi2 : optional (x0, y0, x1, y1) region of each image to detect and describe features in (e.g. the overlap)
+	#exact : always match by brute force, large sets otherwise use the approximate BinaryDescriptorIndex
+	#returned locs are always in full image (row, col) coordinates
+
+	#Only the regions of interest are converted, detected and described
+	I1, offset1 = cropROI(I1, roi1)
+	I2, offset2 = cropROI(I2, roi2)
 
 	#Convert Images to GrayScale
 	grey_I1 = cv2.cvtColor(I1, cv2.COLOR_BGR2GRAY)
@@ -19,8 +40,8 @@ def matchPics(I1, I2):
 	# cv2.destroyAllWindows()
 	
 	#Detect Features in Both Images
-	locs1 = corner_detection(grey_I1, 0.15)
-	locs2 = corner_detection(grey_I2, 0.15)
+	locs1 = corner_detection(grey_I1, 0.15, grid, per_cell, budget)
+	locs2 = corner_detection(grey_I2, 0.15, grid, per_cell, budget)
 
 	print(len(locs1))
 	
@@ -29,8 +50,18 @@ def matchPics(I1, I2):
 	desc2, locs2 = computeBrief(grey_I2, locs2)
 	print("number of descriptors is ", len(desc1))
 
+	#Back to full image coordinates
+	locs1 = locs1 + offset1
+	locs2 = locs2 + offset2
+
 	#Match features using the descriptors
-	matches = briefMatch(desc1, desc2, ratio=.8)
+	#large sets go through the multi-index hash instead of the brute force O(N*M) matcher
+	#it is approximate: a few matches can differ from briefMatch (see BinaryDescriptorIndex)
+	if not exact and len(desc1) * len(desc2) > INDEX_MATCH_THRESHOLD:
+		print("matching approximately with BinaryDescriptorIndex, pass exact=True for brute force")
+		matches = BinaryDescriptorIndex(desc2).match(desc1, ratio=.8)
+	else:
+		matches = briefMatch(desc1, desc2, ratio=.8)
 	print("number of matches is ", len(matches))
 
 	return matches, locs1, locs2
\ No newline at end of file
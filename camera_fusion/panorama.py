@@ -0,0 +1,154 @@
+import numpy as np
+import cv2
+from calibration import Undistorter, calibrate
+from fusion import OUTSIDE, canvas_bounds, canvas_map, estimate_homography, warped_corners
+
+
+def chain_homographies(pairwise: list[np.ndarray], reference: int) -> list[np.ndarray]:
+    """
+    Chains neighbour homographies into one homography per camera that takes it to the reference camera.
+
+    pairwise: pairwise[i] takes camera i+1 into camera i (cameras ordered left to right)
+    reference: index of the camera whose image frame the panorama is built in
+
+    Output: Hs[k] takes camera k into the reference camera
+    """
+    n = len(pairwise) + 1
+    Hs = [None] * n
+    Hs[reference] = np.eye(3)
+    # right of the reference: k -> k-1 -> ... -> reference
+    for k in range(reference + 1, n):
+        Hs[k] = Hs[k - 1] @ pairwise[k - 1]
+    # left of the reference: k -> k+1 -> ... -> reference
+    for k in range(reference - 1, -1, -1):
+        Hs[k] = Hs[k + 1] @ np.linalg.inv(pairwise[k])
+    return [H / H[2, 2] for H in Hs]
+
+
+class PanoramaFusion:
+    """
+    Stitches N cameras (ordered left to right, neighbours overlap) into one panorama.
+
+    Homographies are only estimated between neighbouring cameras and chained to a reference camera, so fitting
+    needs N-1 feature matches. Every camera gets one precomputed remap table (undistortion + homography) that only
+    covers its own bounding box on the canvas, so stitching costs one cv.remap per camera and scales linearly with
+    the number of cameras.
+    """
+    def __init__(self, Hs: list[np.ndarray], intrinsics: list[tuple], canvas_size: tuple[int, int],
+                 offset: tuple[int, int], reference: int, undistorters: list[Undistorter] | None = None):
+        """
+        Hs: per camera homography taking the undistorted frame to the reference camera's undistorted frame
+        intrinsics: (mtx, dist) of every camera, see calibrate
+        canvas_size: (w, h) of the panorama
+        offset: (x, y) position of the reference camera's origin on the canvas
+        reference: index of the reference camera (drawn on top of its neighbours)
+        undistorters: optional Undistorter of every camera to reuse, e.g. the ones fit already built
+        """
+        self.Hs = Hs
+        self.intrinsics = intrinsics
+        self.canvas_size = canvas_size
+        self.offset = offset
+        self.reference = reference
+        self.undistorters = undistorters if undistorters is not None else [Undistorter(*intr) for intr in intrinsics]
+        translation = np.array([[1, 0, offset[0]], [0, 1, offset[1]], [0, 0, 1]])
+        self.canvas_Hs = [translation @ H for H in Hs]
+        # raw frame sizes -> (box, maps, valid mask) of every camera
+        self.tables = {}
+
+    @classmethod
+    def fit(cls, images: list[np.ndarray], intrinsics: list[tuple], reference: int | None = None):
+        """
+        Estimates the neighbour homographies from one set of (distorted) frames.
+
+        images: one frame per camera, ordered left to right
+        intrinsics: (mtx, dist) of every camera
+        reference: camera the panorama is built around, defaults to the middle one (least accumulated warp)
+        """
+        if reference is None:
+            reference = len(images) // 2
+
+        undistorters = [Undistorter(*intr) for intr in intrinsics]
+        undistorted = [undistorter(img) for img, undistorter in zip(images, undistorters)]
+        pairwise = [estimate_homography(undistorted[i], undistorted[i + 1]) for i in range(len(images) - 1)]
+        Hs = chain_homographies(pairwise, reference)
+
+        offset, canvas_size = canvas_bounds(Hs, [img.shape for img in undistorted])
+        return cls(Hs, intrinsics, canvas_size, offset, reference, undistorters)
+
+    def save(self, path: str):
+        np.savez(path, Hs=np.stack(self.Hs), mtx=np.stack([m for m, _ in self.intrinsics]),
+                 dist=np.stack([d.reshape(-1) for _, d in self.intrinsics]), canvas_size=np.array(self.canvas_size),
+                 offset=np.array(self.offset), reference=self.reference)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path) as data:
+            return cls(list(data["Hs"]), list(zip(data["mtx"], data["dist"])),
+                       tuple(int(x) for x in data["canvas_size"]), tuple(int(x) for x in data["offset"]),
+                       int(data["reference"]))
+
+    def _build_tables(self, raw_sizes: tuple) -> list:
+        w, h = self.canvas_size
+        tables = []
+        for undistorter, intr, H, raw_size in zip(self.undistorters, self.intrinsics, self.canvas_Hs, raw_sizes):
+            undistorted_size = undistorter.get_maps(raw_size)[0].shape[1::-1]
+            corners = warped_corners(H, undistorted_size[::-1])
+            x0, y0 = np.maximum(np.floor(corners.min(axis=0)).astype(int), 0)
+            x1, y1 = np.minimum(np.ceil(corners.max(axis=0)).astype(int), (w, h))
+            box = (int(x0), int(y0), int(x1), int(y1))
+
+            coords = canvas_map(intr, raw_size, undistorted_size, H, box)
+            valid = coords[..., 0] != OUTSIDE
+            tables.append((box, coords, valid[..., None]))
+        return tables
+
+    def __call__(self, images: list[np.ndarray], out: np.ndarray | None = None) -> np.ndarray:
+        """
+        Stitches one (distorted) frame per camera. The remap tables are built on the first call for each set of
+        frame sizes.
+
+        out: optional (h, w, 3) canvas to write into
+        """
+        raw_sizes = tuple(img.shape[1::-1] for img in images)
+        if raw_sizes not in self.tables:
+            self.tables[raw_sizes] = self._build_tables(raw_sizes)
+
+        if out is None:
+            out = np.zeros((self.canvas_size[1], self.canvas_size[0], 3), dtype=images[0].dtype)
+        else:
+            out.fill(0)
+
+        # cameras farther from the reference first, so nearer (less warped) cameras end up on top in the overlaps
+        order = sorted(range(len(images)), key=lambda k: -abs(k - self.reference))
+        for k in order:
+            (x0, y0, x1, y1), coords, valid = self.tables[raw_sizes][k]
+            warped = cv2.remap(images[k], coords, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+            np.copyto(out[y0:y1, x0:x1], warped, where=valid)
+
+        return out
+
+
+def fuse_frames(im_paths: list[str], calib_paths: list[str], fusion_path: str | None = None,
+                output_path: str = "homography_result.jpg") -> np.ndarray:
+    """ fuses the frames of N cameras (ordered left to right) into one panorama.
+
+    Inputs:
+    im_paths list[str]: path to the image of every camera (should end in '.jpg')
+    calib_paths list[str]: path to the folder of calibration images of every camera
+    fusion_path str: optional path (.npz) to save the fitted PanoramaFusion to, for headless stitching of later frames
+    output_path str: where the panorama is written, the labeling scripts and main.py read homography_result.jpg
+
+    Output:
+    panorama np.ndarray: fused image
+    """
+    intrinsics = [calibrate(path)[1:3] for path in calib_paths]
+    images = [cv2.imread(path) for path in im_paths]
+
+    fusion = PanoramaFusion.fit(images, intrinsics)
+    if fusion_path is not None:
+        fusion.save(fusion_path)
+
+    panorama = fusion(images)
+    cv2.imwrite(output_path, panorama)
+
+    return panorama
@@ -0,0 +1,190 @@
+import copy
+import queue
+import threading
+import time
+import numpy as np
+import cv2
+from fusion import FrameFusion, RemapStitcher
+
+# end of stream marker passed through the queues
+_DONE = None
+# seconds a blocked queue operation waits before checking whether the pipeline was stopped
+_POLL = 0.1
+
+
+class StageStats:
+    """Frame count and busy time of one pipeline stage (time spent blocked on the queues is not counted)"""
+    def __init__(self, name: str):
+        self.name = name
+        self.frames = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.frames += 1
+            self.busy += seconds
+
+    def fps(self) -> float:
+        """Frames per second the stage could sustain on its own"""
+        return self.frames / self.busy if self.busy > 0 else float("inf")
+
+
+def _put(q: queue.Queue, item, stop: threading.Event):
+    """Blocking put that gives up once the pipeline is stopped (the consumer may be gone)"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=_POLL)
+            return
+        except queue.Full:
+            pass
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Blocking get that returns _DONE once the pipeline is stopped (the producer may be gone)"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=_POLL)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _run_stage(stage, errors: list, stop: threading.Event, *args):
+    """Thread target: records the exception of a failing stage and stops the whole pipeline"""
+    try:
+        stage(*args, stop)
+    except BaseException as e:
+        errors.append(e)
+        stop.set()
+
+
+def _decode(left_cap, right_cap, out_queue: queue.Queue, stats: StageStats, max_frames: int | None,
+            stop: threading.Event):
+    try:
+        index = 0
+        while not stop.is_set() and (max_frames is None or index < max_frames):
+            start = time.perf_counter()
+            ok_left, left = left_cap.read()
+            ok_right, right = right_cap.read()
+            if not (ok_left and ok_right):
+                break
+            stats.add(time.perf_counter() - start)
+            _put(out_queue, (index, left, right), stop)
+            index += 1
+    finally:
+        left_cap.release()
+        right_cap.release()
+        _put(out_queue, _DONE, stop)
+
+
+def _stitch(stitcher, in_queue: queue.Queue, out_queue: queue.Queue, stats: StageStats, stop: threading.Event):
+    try:
+        while True:
+            item = _get(in_queue, stop)
+            if item is _DONE:
+                return
+            index, left, right = item
+            start = time.perf_counter()
+            # every frame gets its own canvas, it is still in flight to the writer when the next one is stitched
+            stitched = stitcher(left, right, np.empty((stitcher.canvas_size[1], stitcher.canvas_size[0], 3), left.dtype))
+            stats.add(time.perf_counter() - start)
+            _put(out_queue, (index, stitched), stop)
+    finally:
+        # let the other stitch workers see the marker too
+        _put(in_queue, _DONE, stop)
+        _put(out_queue, _DONE, stop)
+
+
+def _encode(writer, in_queue: queue.Queue, stats: StageStats, n_stitchers: int, stop: threading.Event):
+    # stitch workers can finish out of order, frames are buffered until the next index arrives
+    pending = {}
+    next_index = 0
+    finished = 0
+    while finished < n_stitchers:
+        item = _get(in_queue, stop)
+        if stop.is_set():
+            return
+        if item is _DONE:
+            finished += 1
+            continue
+        index, stitched = item
+        pending[index] = stitched
+        while next_index in pending:
+            start = time.perf_counter()
+            writer.write(pending.pop(next_index))
+            stats.add(time.perf_counter() - start)
+            next_index += 1
+
+
+def stitch_video(left_path: str, right_path: str, output_path: str, fusion: FrameFusion | str,
+                 n_stitchers: int = 2, queue_size: int = 8, fourcc: str = "mp4v", fps: float | None = None,
+                 max_frames: int | None = None) -> dict:
+    """ stitches two synchronized camera recordings into one video.
+
+    Decode, stitch (undistort + warp through a RemapStitcher) and encode run in their own threads, connected by
+    bounded queues, so the stages overlap (OpenCV releases the GIL while it works). If any stage raises, the
+    pipeline is stopped and the exception is re-raised here once every thread has finished.
+
+    Inputs:
+    left_path str: left camera video
+    right_path str: right camera video
+    output_path str: stitched video to write
+    fusion FrameFusion | str: fitted FrameFusion, or the .npz it was saved to
+    n_stitchers int: number of stitch worker threads
+    queue_size int: capacity of every queue (bounds memory when one stage is slower)
+    fourcc str: codec of the output video
+    fps float: frame rate of the output, defaults to the left video's
+    max_frames int: stop after this many frame pairs
+
+    Output:
+    stats dict: frames and frames per second of every stage ("decode", "stitch", "encode") and of the whole pipeline
+    """
+    if isinstance(fusion, str):
+        fusion = FrameFusion.load(fusion)
+
+    left_cap = cv2.VideoCapture(left_path)
+    right_cap = cv2.VideoCapture(right_path)
+    left_size = (int(left_cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(left_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    right_size = (int(right_cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(right_cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    if fps is None:
+        fps = left_cap.get(cv2.CAP_PROP_FPS) or 30
+
+    stitcher = RemapStitcher(fusion, left_size, right_size)
+    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*fourcc), fps, stitcher.canvas_size)
+
+    stats = {name: StageStats(name) for name in ("decode", "stitch", "encode")}
+    decoded = queue.Queue(maxsize=queue_size)
+    stitched = queue.Queue(maxsize=queue_size)
+
+    errors = []
+    stop = threading.Event()
+    threads = [threading.Thread(target=_run_stage, args=(_decode, errors, stop, left_cap, right_cap, decoded,
+                                                         stats["decode"], max_frames))]
+    # each worker gets its own shallow copy: the remap tables are shared, the internal canvas is not
+    threads += [threading.Thread(target=_run_stage, args=(_stitch, errors, stop, copy.copy(stitcher), decoded,
+                                                          stitched, stats["stitch"]))
+                for _ in range(n_stitchers)]
+    threads.append(threading.Thread(target=_run_stage, args=(_encode, errors, stop, writer, stitched,
+                                                             stats["encode"], n_stitchers)))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    # the decoder releases the captures
+    writer.release()
+    if errors:
+        raise errors[0]
+
+    report = {name: {"frames": s.frames, "fps": s.fps()} for name, s in stats.items()}
+    # stitch busy time is summed over workers, per worker throughput times the worker count is what the stage delivers
+    report["stitch"]["fps"] *= n_stitchers
+    report["pipeline"] = {"frames": stats["encode"].frames, "fps": stats["encode"].frames / elapsed}
+    for name, r in report.items():
+        print(f"{name}: {r['frames']} frames, {r['fps']:.1f} fps")
+
+    return report
@@ -0,0 +1,90 @@
+# Compiles the point_to_pixel HSV color ranges into a single lookup table.
+# One cvtColor + one table gather labels every pixel with every color, no matter how many ranges there are.
+
+import numpy as np
+import cv2
+import yaml
+
+# OpenCV 8 bit HSV: H in [0, 179], S and V in [0, 255]
+LUT_SHAPE = (180, 256, 256)
+
+
+def load_color_ranges(yaml_path: str) -> dict[str, list[tuple[list, list]]]:
+    """
+    Reads the /point_to_pixel color ranges from a params yaml.
+
+    Understands both the single range format of scripts/color_calibration.py ({color}_filter_low/high) and the
+    multi range format of scripts/color_calibration2.py ({color}_ranges: {ranges: [{min, max}, ...]}).
+
+    output color_ranges: {color: [(lower_hsv, upper_hsv), ...]}
+    """
+    with open(yaml_path, "r") as f:
+        params = yaml.safe_load(f)["/point_to_pixel"]["ros__parameters"]
+
+    color_ranges = {}
+    for key, value in params.items():
+        if key.endswith("_filter_low"):
+            color = key[:-len("_filter_low")]
+            color_ranges.setdefault(color, []).append((value, params[f"{color}_filter_high"]))
+        elif key.endswith("_ranges") and isinstance(value, dict):
+            color = key[:-len("_ranges")]
+            color_ranges.setdefault(color, []).extend((r["min"], r["max"]) for r in value.get("ranges", []))
+
+    return color_ranges
+
+
+def compile_hsv_lut(color_ranges: dict[str, list[tuple[list, list]]]) -> tuple[np.ndarray, list[str]]:
+    """
+    Turns every color range into one H x S x V label table. Bit i of an entry is set when that HSV value
+    falls inside any range of color i (inclusive bounds, same as cv2.inRange).
+
+    input color_ranges: {color: [(lower_hsv, upper_hsv), ...]}, at most 8 colors
+
+    output lut: (180, 256, 256) uint8 bit packed labels
+    output colors: color name of every bit, colors[i] is bit 1 << i
+    """
+    colors = list(color_ranges)
+    assert len(colors) <= 8, "a uint8 table holds at most 8 colors"
+
+    lut = np.zeros(LUT_SHAPE, dtype=np.uint8)
+    for bit, color in enumerate(colors):
+        for lower, upper in color_ranges[color]:
+            (lh, ls, lv), (uh, us, uv) = lower, upper
+            lut[lh:uh + 1, ls:us + 1, lv:uv + 1] |= np.uint8(1 << bit)
+
+    return lut, colors
+
+
+def _gather(lut: np.ndarray, hsv: np.ndarray) -> np.ndarray:
+    """Looks up (..., 3) uint8 HSV values in the table with one flat gather"""
+    flat = (hsv[..., 0].astype(np.int32) << 16) | (hsv[..., 1].astype(np.int32) << 8) | hsv[..., 2]
+    return lut.ravel()[flat]
+
+
+def label_image(image: np.ndarray, lut: np.ndarray) -> np.ndarray:
+    """
+    input image: (h, w, 3) BGR image
+    input lut: table from compile_hsv_lut
+
+    output labels: (h, w) uint8 color bits of every pixel
+    """
+    return _gather(lut, cv2.cvtColor(image, cv2.COLOR_BGR2HSV))
+
+
+def label_pixels(image: np.ndarray, lut: np.ndarray, pixels: np.ndarray) -> np.ndarray:
+    """
+    Labels only the given pixels (e.g. projected LiDAR points), converting just those to HSV.
+
+    input image: (h, w, 3) BGR image
+    input lut: table from compile_hsv_lut
+    input pixels: (M, 2) pixel coordinates (u, v) inside the image, e.g. from projection.project_points
+
+    output labels: (M,) uint8 color bits of every pixel
+    """
+    if pixels.shape[0] == 0:
+        return np.zeros(0, dtype=np.uint8)
+
+    px = pixels.astype(np.int64)
+    bgr = image[px[:, 1], px[:, 0]]
+    hsv = cv2.cvtColor(bgr[:, None, :], cv2.COLOR_BGR2HSV)[:, 0]
+    return _gather(lut, hsv)
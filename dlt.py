@@ -2,29 +2,187 @@
 
 import numpy as np
 
-# TODO: Add support for least squares regression when using redundant points
-def dlt(cam_data: list, lidar_data: list) -> np.ndarray:
+
+def _normalization_transform(points: np.ndarray) -> np.ndarray:
+    """
+    Hartley normalization for a set of (..., N, d) points.
+
+    Translates the centroid to the origin and scales so the mean distance from the origin is sqrt(d).
+
+    output T: (..., d+1, d+1) similarity transform acting on homogeneous points
+    """
+    d = points.shape[-1]
+    centroid = points.mean(axis=-2)
+    mean_dist = np.linalg.norm(points - centroid[..., None, :], axis=-1).mean(axis=-1)
+    scale = np.sqrt(d) / mean_dist
+
+    T = np.zeros(points.shape[:-2] + (d + 1, d + 1))
+    T[..., np.arange(d), np.arange(d)] = scale[..., None]
+    T[..., :d, d] = -scale[..., None] * centroid
+    T[..., d, d] = 1
+    return T
+
+
+def _apply_transform(T: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Applies a (..., d+1, d+1) normalization transform to (..., N, d) points"""
+    d = points.shape[-1]
+    return points * T[..., None, :1, 0] + T[..., None, :d, d]
+
+
+def _design_matrix(cam_data: np.ndarray, lidar_data: np.ndarray) -> np.ndarray:
+    """
+    Stacks the 2 DLT equations per correspondence into a (..., 2N, 12) matrix (see README).
+
+    Rows 2i and 2i+1 are [-X_i^T, 0, u_i X_i^T] and [0, -X_i^T, v_i X_i^T] for homogeneous X_i.
+    """
+    n = cam_data.shape[-2]
+    X = np.concatenate((lidar_data, np.ones(lidar_data.shape[:-1] + (1,))), axis=-1)
+
+    mat = np.zeros(cam_data.shape[:-1] + (2, 12))
+    mat[..., 0, 0:4] = -X
+    mat[..., 1, 4:8] = -X
+    mat[..., 8:12] = cam_data[..., :, None] * X[..., None, :]
+
+    return mat.reshape(cam_data.shape[:-2] + (2 * n, 12))
+
+
+def dlt(cam_data: np.ndarray, lidar_data: np.ndarray) -> np.ndarray:
+    """
+    Implements a direct linear transform from N >= 6 lidar points to N camera pixels.
+
+    With more than 6 points the system is over-determined and the algebraic error is minimized in the
+    least squares sense. Both point sets are Hartley normalized before solving for numerical stability.
+
+    input cam_data: (N, 2) camera points (u, v) which correspond to LiDAR
+    input lidar_data: (N, 3) LiDAR points (x, y, z) which correspond to camera
+
+    output projection_matrix: (3, 4) projects LiDAR points to camera space, scaled to unit norm
+    """
+    cam_data = np.asarray(cam_data, dtype=np.float64)
+    lidar_data = np.asarray(lidar_data, dtype=np.float64)
+
+    assert cam_data.shape[0] == lidar_data.shape[0], "cam_data and lidar_data must have the same number of points"
+    assert cam_data.shape[0] >= 6, "DLT requires at least 6 correspondences"
+
+    T_cam = _normalization_transform(cam_data)
+    T_lidar = _normalization_transform(lidar_data)
+
+    mat = _design_matrix(_apply_transform(T_cam, cam_data), _apply_transform(T_lidar, lidar_data))
+
+    # the right singular vector of the smallest singular value is the least squares solution of A p = 0, |p| = 1
+    _, _, Vt = np.linalg.svd(mat, full_matrices=False)
+    P_norm = Vt[-1].reshape(3, 4)
+
+    # undo the normalization: x = T_cam^-1 P_norm T_lidar X
+    P = np.linalg.inv(T_cam) @ P_norm @ T_lidar
+
+    return P / np.linalg.norm(P)
+
+
+def dlt_batch(cam_data: np.ndarray, lidar_data: np.ndarray) -> np.ndarray:
+    """
+    Solves B independent DLT problems in one call (e.g. several sessions or bootstrap subsets).
+
+    Every set is Hartley normalized on its own. Instead of a per-set SVD of the (2N, 12) design matrix,
+    the (B, 12, 12) normal matrices A^T A are built with one batched matmul and the eigenvector of the
+    smallest eigenvalue is taken from a single stacked np.linalg.eigh call.
+
+    input cam_data: (B, N, 2) camera points (u, v), N >= 6
+    input lidar_data: (B, N, 3) LiDAR points (x, y, z)
+
+    output projection_matrices: (B, 3, 4) projection matrices, each scaled to unit norm
+    """
+    cam_data = np.asarray(cam_data, dtype=np.float64)
+    lidar_data = np.asarray(lidar_data, dtype=np.float64)
+
+    assert cam_data.ndim == 3 and lidar_data.ndim == 3, "expected stacked (B, N, 2) and (B, N, 3) arrays"
+    assert cam_data.shape[:2] == lidar_data.shape[:2], "cam_data and lidar_data must have the same B and N"
+    assert cam_data.shape[1] >= 6, "DLT requires at least 6 correspondences"
+
+    T_cam = _normalization_transform(cam_data)
+    T_lidar = _normalization_transform(lidar_data)
+
+    mat = _design_matrix(_apply_transform(T_cam, cam_data), _apply_transform(T_lidar, lidar_data))
+    normal = np.swapaxes(mat, -1, -2) @ mat
+
+    # eigh sorts eigenvalues ascending, so column 0 is the least squares solution
+    _, eigvecs = np.linalg.eigh(normal)
+    P_norm = eigvecs[..., 0].reshape(-1, 3, 4)
+
+    P = np.linalg.inv(T_cam) @ P_norm @ T_lidar
+
+    return P / np.linalg.norm(P, axis=(1, 2), keepdims=True)
+
+
+def reprojection_error(projection_matrix: np.ndarray, cam_data: np.ndarray, lidar_data: np.ndarray) -> np.ndarray:
+    """
+    Pixel distance between the camera points and the projected LiDAR points.
+
+    input projection_matrix: (3, 4) or stacked (H, 3, 4) projection matrices
+    input cam_data: (N, 2) camera points (u, v)
+    input lidar_data: (N, 3) LiDAR points (x, y, z)
+
+    output error: (N,) or (H, N) reprojection error in pixels for every matrix and point
+    """
+    X = np.hstack((lidar_data, np.ones((lidar_data.shape[0], 1))))
+
+    # (..., 3, 4) @ (4, N) projects every point with every matrix at once
+    proj = projection_matrix @ X.T
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uv = proj[..., :2, :] / proj[..., 2:, :]
+        err = np.linalg.norm(uv - cam_data.T, axis=-2)
+
+    return np.where(np.isfinite(err), err, np.inf)
+
+
+def dlt_ransac(cam_data: np.ndarray, lidar_data: np.ndarray, threshold: float = 5.0, n_iters: int = 1000,
+               seed: int = 0, chunk_size: int = 64) -> tuple[np.ndarray, np.ndarray]:
     """
-    Implements a direct linear transform for 6 lidar points to 6 camera pixels.
+    Outlier robust DLT. Draws minimal 6 point samples in chunks of chunk_size, solves each chunk with dlt_batch
+    and scores the reprojection inliers of the whole chunk in one matrix product, keeping the best hypothesis
+    so far. Memory grows with chunk_size x N instead of n_iters x N. The hypothesis with the most inliers is
+    refit on all of its inliers with dlt.
 
-    input cam_data: at least 6 camera points (u, v) which correspond to LiDAR
-    input lidar_data: at least 6 LiDAR points (x, y, z) which correspond to camera
+    input cam_data: (N, 2) camera points (u, v), N >= 6
+    input lidar_data: (N, 3) LiDAR points (x, y, z)
+    input threshold: maximum reprojection error in pixels for a point to count as an inlier
+    input n_iters: number of minimal samples (hypotheses)
+    input seed: seed of the sampler so results are reproducible
+    input chunk_size: number of hypotheses sampled, solved and scored at once
 
-    output projection_matrix: projects LiDAR points to camera space
+    output projection_matrix: (3, 4) projection matrix refit on the inliers
+    output inliers: (N,) boolean inlier mask
     """
-    assert cam_data.shape[0] == 6
+    cam_data = np.asarray(cam_data, dtype=np.float64)
+    lidar_data = np.asarray(lidar_data, dtype=np.float64)
+    n = cam_data.shape[0]
+
+    assert n == lidar_data.shape[0], "cam_data and lidar_data must have the same number of points"
+    assert n >= 6, "DLT requires at least 6 correspondences"
+
+    rng = np.random.default_rng(seed)
+    best_P, best_count = None, -1
+    for start in range(0, n_iters, chunk_size):
+        k = min(chunk_size, n_iters - start)
+
+        # 6 distinct indices per row: the positions of the 6 smallest keys of a random permutation
+        samples = np.argpartition(rng.random((k, n)), 5, axis=1)[:, :6]
+
+        # degenerate (e.g. repeated or coplanar) samples produce junk hypotheses that simply score few inliers
+        with np.errstate(divide="ignore", invalid="ignore"):
+            hypotheses = dlt_batch(cam_data[samples], lidar_data[samples])
 
-    mat = []
+        counts = (reprojection_error(hypotheses, cam_data, lidar_data) < threshold).sum(axis=1)
+        best = counts.argmax()
+        if counts[best] > best_count:
+            best_P, best_count = hypotheses[best], counts[best]
 
-    for i in range(cam_data.shape[0]):
-        X, Y, Z = lidar_data[i]
-        u, v = cam_data[i]
+    inliers = reprojection_error(best_P, cam_data, lidar_data) < threshold
+    if inliers.sum() < 6:
+        return best_P, inliers
 
-        mat.append([-X, -Y, -Z, -1, 0, 0, 0, 0, u*X, u*Y, u*Z, u])
-        mat.append([0, 0, 0, 0, -X, -Y, -Z, -1, v*X, v*Y, v*Z, v])
-        
-    mat = np.stack(mat)
-    
-    _, _, Vt = np.linalg.svd(mat)
+    P = dlt(cam_data[inliers], lidar_data[inliers])
+    inliers = reprojection_error(P, cam_data, lidar_data) < threshold
 
-    return Vt[-1].reshape(3, 4)
\ No newline at end of file
+    return P, inliers
@@ -2,6 +2,7 @@
 # Test DLT from lidar to camera
 
 from dlt import dlt
+from projection import project_points
 import numpy as np
 import cv2
 
@@ -27,27 +28,19 @@ test_points = np.array([
     [4.535505771636963, 3.7224624156951904, 0.07677774876356125],
     [3.4350616931915283, 0.717289388179779, 0.14139263331890106]
 ])
-test_points = np.hstack((test_points, np.ones((test_points.shape[0], 1))))
 
 image = cv2.imread(img_path)
 color = (0, 0, 255)
 
-transformed_points = []
+# project every point at once (pixels are truncated to ints like before)
+pixels, depths, _ = project_points(dlt_mat, test_points)
+transformed_points = pixels.astype(int)
 
-for i in range(test_points.shape[0]):
-    print(dlt_mat @ test_points[i])
-
-    x, y, z = dlt_mat @ test_points[i]   
-
-    # divide by z to get the euclidean normed coordinates
-    u, v = int(x/z), int(y/z)
-
-    transformed_points.append(np.array([u, v]))
-
-    print(u,v)
+for (u, v), depth in zip(transformed_points, depths):
+    print(u, v, depth)
 
     # Draw a circle at the transformed point
-    cv2.circle(image, (u, v), 10, color, -1)
+    cv2.circle(image, (int(u), int(v)), 10, color, -1)
 
 # np.savetxt("pixel.out", np.stack(transformed_points), delimiter=', ')
 
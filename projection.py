@@ -0,0 +1,125 @@
+# Projects full LiDAR scans into the camera with the DLT projection matrix.
+
+import numpy as np
+
+
+def _metric_projection(projection_matrix: np.ndarray) -> np.ndarray:
+    """
+    Rescales P so that the homogeneous coordinate w of a projected point is its depth along the optical axis.
+
+    dlt returns P with unit norm and an arbitrary sign. For P = K R [I | -X0] with K[2, 2] = 1 the last row of
+    the left 3x3 block is a unit vector and det(KR) > 0, so both can be restored from any scalar multiple.
+    """
+    P = np.asarray(projection_matrix, dtype=np.float64)
+    scale = np.linalg.norm(P[2, :3])
+    if np.linalg.det(P[:, :3]) < 0:
+        scale = -scale
+    return P / scale
+
+
+def project_points(projection_matrix: np.ndarray, points: np.ndarray, image_shape: tuple | None = None,
+                   min_depth: float = 0.0, dtype=np.float32,
+                   out: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Projects an entire LiDAR cloud into pixel space with one matmul, no per point Python loop.
+
+    input projection_matrix: (3, 4) projection matrix, e.g. the output of dlt
+    input points: (N, 3) LiDAR points (x, y, z)
+    input image_shape: (h, w, ...) of the camera image, points projecting outside of it are culled. None disables
+    input min_depth: points with depth <= min_depth (behind the camera) are culled
+    input dtype: float dtype used for the projection and the outputs (float32 by default)
+    input out: optional (N, 2) buffer of dtype that receives the pixels, so it can be reused across scans
+
+    output pixels: (M, 2) pixel coordinates (u, v) of the kept points (a view into out if given)
+    output depths: (M,) depth of the kept points along the optical axis, in LiDAR units
+    output index: (M,) index of every kept point into points
+    """
+    P = _metric_projection(projection_matrix).astype(dtype)
+
+    homog = np.asarray(points, dtype=dtype) @ P[:, :3].T
+    homog += P[:, 3]
+
+    depth = homog[:, 2]
+    keep = depth > min_depth
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        uv = homog[:, :2]
+        uv /= depth[:, None]
+
+    if image_shape is not None:
+        h, w = image_shape[:2]
+        keep &= (uv[:, 0] >= 0) & (uv[:, 0] < w) & (uv[:, 1] >= 0) & (uv[:, 1] < h)
+
+    index = np.flatnonzero(keep)
+
+    if out is None:
+        pixels = uv[index]
+    else:
+        assert out.dtype == dtype and out.shape[1:] == (2,) and out.shape[0] >= points.shape[0], "out must be an (N, 2) array of dtype"
+        pixels = np.take(uv, index, axis=0, out=out[:index.shape[0]])
+
+    return pixels, depth[index], index
+
+
+class DepthRasterizer:
+    """
+    Z-buffers projected LiDAR points into a sparse per pixel nearest depth image.
+
+    Resolves occlusions (e.g. two cones in front of each other) without a per point loop: the points are
+    lexsorted by (pixel, depth) and the first entry of every pixel run is the nearest one.
+    The depth and index buffers are allocated once and reused for every scan, so the returned images are
+    overwritten by the next call to rasterize (copy them if they need to outlive the frame).
+    """
+    def __init__(self, image_shape: tuple, splat_radius: int = 0, dtype=np.float32):
+        """
+        input image_shape: (h, w, ...) of the camera image
+        input splat_radius: every point also covers the (2r+1)x(2r+1) pixels around it (0 is a single pixel)
+        input dtype: float dtype of the depth image
+        """
+        self.h, self.w = image_shape[:2]
+        self.depth = np.empty((self.h, self.w), dtype=dtype)
+        self.index = np.empty((self.h, self.w), dtype=np.int64)
+
+        r = splat_radius
+        dv, du = np.mgrid[-r:r + 1, -r:r + 1]
+        self.offsets = np.column_stack((du.ravel(), dv.ravel()))
+
+    def rasterize(self, pixels: np.ndarray, depths: np.ndarray,
+                  index: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        input pixels: (M, 2) pixel coordinates (u, v), e.g. from project_points
+        input depths: (M,) depth of every point
+        input index: (M,) id written to the index image for every point (defaults to 0..M-1)
+
+        output depth: (h, w) nearest depth per pixel, inf where no point landed
+        output index: (h, w) id of the nearest point per pixel, -1 where no point landed
+        """
+        self.depth.fill(np.inf)
+        self.index.fill(-1)
+
+        if index is None:
+            index = np.arange(pixels.shape[0])
+
+        # round to the containing pixel, then splat onto the footprint (M, k, 2)
+        px = np.floor(pixels).astype(np.int64)
+        if self.offsets.shape[0] > 1:
+            px = (px[:, None, :] + self.offsets).reshape(-1, 2)
+            depths = np.repeat(depths, self.offsets.shape[0])
+            index = np.repeat(index, self.offsets.shape[0])
+
+        inside = (px[:, 0] >= 0) & (px[:, 0] < self.w) & (px[:, 1] >= 0) & (px[:, 1] < self.h)
+        flat = px[inside, 1] * self.w + px[inside, 0]
+        depths = depths[inside]
+        index = index[inside]
+
+        # sort by pixel, then depth: the first point of every pixel run is the closest
+        order = np.lexsort((depths, flat))
+        flat = flat[order]
+        first = np.ones(flat.shape[0], dtype=bool)
+        first[1:] = flat[1:] != flat[:-1]
+
+        nearest = order[first]
+        self.depth.ravel()[flat[first]] = depths[nearest]
+        self.index.ravel()[flat[first]] = index[nearest]
+
+        return self.depth, self.index
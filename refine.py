@@ -0,0 +1,155 @@
+# Nonlinear refinement of the DLT projection matrix.
+# The DLT minimizes algebraic error, this minimizes the geometric reprojection error over P = K R [I | -X0] (see README)
+
+import numpy as np
+import scipy.linalg
+from scipy.spatial.transform import Rotation
+
+
+def decompose_projection(projection_matrix: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Splits a projection matrix into P = K R [I | -X0].
+
+    input projection_matrix: (3, 4) projection matrix (any scale or sign, e.g. from dlt)
+
+    output K: (3, 3) upper triangular intrinsics with a positive diagonal and K[2, 2] = 1
+    output R: (3, 3) rotation matrix from LiDAR to camera frame
+    output X0: (3,) location of the camera in LiDAR space
+    """
+    P = np.asarray(projection_matrix, dtype=np.float64)
+
+    # P is only known up to scale, the sign with det(KR) > 0 puts the points in front of the camera
+    if np.linalg.det(P[:, :3]) < 0:
+        P = -P
+
+    M = P[:, :3]
+    K, R = scipy.linalg.rq(M)
+
+    # rq is unique up to the signs of K's diagonal, flip them so that K has a positive diagonal
+    D = np.diag(np.sign(np.diag(K)))
+    K = K @ D
+    R = D @ R
+
+    X0 = -np.linalg.solve(M, P[:, 3])
+
+    return K / K[2, 2], R, X0
+
+
+def compose_projection(K: np.ndarray, R: np.ndarray, X0: np.ndarray) -> np.ndarray:
+    """Builds P = K R [I | -X0]"""
+    return K @ R @ np.hstack((np.eye(3), -X0.reshape(3, 1)))
+
+
+def _residuals_and_jacobian(params: np.ndarray, R: np.ndarray, cam_data: np.ndarray,
+                            lidar_data: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Reprojection residuals (2N,) and their analytic Jacobian (2N, 11).
+
+    params are [fx, fy, s, cx, cy, w (3), X0 (3)]. w is a small rotation applied on top of R, the Jacobian
+    is evaluated at w = 0 so d(R X)/dw = -[R X]_x.
+    """
+    fx, fy, s, cx, cy = params[:5]
+    X0 = params[8:11]
+    R = Rotation.from_rotvec(params[5:8]).as_matrix() @ R
+
+    Xc = (lidar_data - X0) @ R.T
+    z = Xc[:, 2]
+    x = Xc[:, 0] / z
+    y = Xc[:, 1] / z
+
+    u = fx * x + s * y + cx
+    v = fy * y + cy
+    residuals = np.column_stack((u, v)) - cam_data
+
+    n = lidar_data.shape[0]
+    J = np.zeros((n, 2, 11))
+
+    # intrinsics
+    J[:, 0, 0] = x
+    J[:, 0, 2] = y
+    J[:, 0, 3] = 1
+    J[:, 1, 1] = y
+    J[:, 1, 4] = 1
+
+    # d(u, v) / d(Xc)
+    dproj = np.zeros((n, 2, 3))
+    dproj[:, 0, 0] = fx / z
+    dproj[:, 0, 1] = s / z
+    dproj[:, 0, 2] = -(fx * x + s * y) / z
+    dproj[:, 1, 1] = fy / z
+    dproj[:, 1, 2] = -fy * y / z
+
+    # d(Xc) / dw = -[Xc]_x
+    skew = np.zeros((n, 3, 3))
+    skew[:, 0, 1] = Xc[:, 2]
+    skew[:, 0, 2] = -Xc[:, 1]
+    skew[:, 1, 0] = -Xc[:, 2]
+    skew[:, 1, 2] = Xc[:, 0]
+    skew[:, 2, 0] = Xc[:, 1]
+    skew[:, 2, 1] = -Xc[:, 0]
+
+    J[:, :, 5:8] = dproj @ skew
+    # d(Xc) / dX0 = -R
+    J[:, :, 8:11] = -dproj @ R
+
+    return residuals.reshape(-1), J.reshape(2 * n, 11)
+
+
+def refine_projection(projection_matrix: np.ndarray, cam_data: np.ndarray, lidar_data: np.ndarray,
+                      max_iters: int = 20, tol: float = 1e-10) -> np.ndarray:
+    """
+    Levenberg-Marquardt refinement of a projection matrix seeded from the DLT.
+
+    Minimizes the sum of squared pixel reprojection errors over K (fx, fy, skew, cx, cy), R and X0 with an
+    analytic Jacobian. Every iteration is a handful of vectorized (N, 2, 11) operations and one 11x11 solve.
+
+    input projection_matrix: (3, 4) initial projection matrix, e.g. the output of dlt or dlt_ransac
+    input cam_data: (N, 2) camera points (u, v)
+    input lidar_data: (N, 3) LiDAR points (x, y, z)
+    input max_iters: maximum number of LM iterations
+    input tol: stop once the relative decrease in cost falls below this value
+
+    output projection_matrix: (3, 4) refined projection matrix, scaled to unit norm
+    """
+    cam_data = np.asarray(cam_data, dtype=np.float64)
+    lidar_data = np.asarray(lidar_data, dtype=np.float64)
+
+    K, R, X0 = decompose_projection(projection_matrix)
+    params = np.array([K[0, 0], K[1, 1], K[0, 1], K[0, 2], K[1, 2], 0, 0, 0, *X0])
+
+    residuals, J = _residuals_and_jacobian(params, R, cam_data, lidar_data)
+    cost = residuals @ residuals
+    damping = 1e-3
+
+    for _ in range(max_iters):
+        JtJ = J.T @ J
+        Jtr = J.T @ residuals
+
+        # Marquardt scaling by diag(JtJ) copes with the very different scales of focal length and rotation
+        step = np.linalg.solve(JtJ + damping * np.diag(np.diag(JtJ)), -Jtr)
+        candidate = params + step
+
+        new_residuals, new_J = _residuals_and_jacobian(candidate, R, cam_data, lidar_data)
+        new_cost = new_residuals @ new_residuals
+
+        if new_cost < cost:
+            # fold the rotation update into R so the Jacobian stays evaluated at w = 0
+            R = Rotation.from_rotvec(candidate[5:8]).as_matrix() @ R
+            candidate[5:8] = 0
+
+            converged = (cost - new_cost) < tol * cost
+            params, residuals, J, cost = candidate, new_residuals, new_J, new_cost
+            damping /= 10
+            if converged:
+                break
+        else:
+            damping *= 10
+
+    K = np.array([
+        [params[0], params[2], params[3]],
+        [0, params[1], params[4]],
+        [0, 0, 1]
+    ])
+    P = compose_projection(K, R, params[8:11])
+
+    return P / np.linalg.norm(P)
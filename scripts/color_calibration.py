@@ -7,6 +7,8 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 from tkinter.ttk import Notebook
 from PIL import Image, ImageTk
+# Slider ticks arriving within this many milliseconds are coalesced into one preview update.
+PREVIEW_DELAY_MS = 30
 class HSVCalibrationUI:
     def __init__(self, frame_path, preview_size=(300, 225), init_display_size=(600, 450)):
         self.root = tk.Tk()
@@ -20,6 +22,13 @@ class HSVCalibrationUI:
         if self.orig_image is None:
             print(f"Error: Unable to load image from path {self.frame_path}", file=sys.stderr)
             sys.exit(1)
+        # The previews only show preview_size pixels, so the image is downscaled and converted to HSV (and RGB
+        # for display) once, every slider tick then only runs inRange and a masked copy at preview resolution.
+        self.preview_bgr = cv2.resize(self.orig_image, self.preview_size, interpolation=cv2.INTER_AREA)
+        self.preview_hsv = cv2.cvtColor(self.preview_bgr, cv2.COLOR_BGR2HSV)
+        self.preview_rgb = cv2.cvtColor(self.preview_bgr, cv2.COLOR_BGR2RGB)
+        # Pending root.after ids of the debounced preview updates, per color.
+        self.pending_previews = {}
         # Order for preview panels.
         self.color_order = ["blue", "orange", "yellow"]
         # Default HSV ranges.
@@ -128,7 +137,7 @@ class HSVCalibrationUI:
         self.screenshot_canvas.image = self.photo_main
     def create_slider(self, parent, label_text, frm, to, var, color):
         scale = tk.Scale(parent, label=label_text, from_=frm, to=to, orient=tk.HORIZONTAL,
-                         variable=var, command=lambda event: self.update_preview(color))
+                         variable=var, command=lambda event: self.schedule_preview(color))
         scale.pack(fill=tk.X, padx=5, pady=2)
         return scale
     def create_sliders_for_color(self, parent, color):
@@ -140,15 +149,19 @@ class HSVCalibrationUI:
         self.create_slider(parent, "H", 0, 179, self.color_vars[color]["uh"], color)
         self.create_slider(parent, "S", 0, 255, self.color_vars[color]["us"], color)
         self.create_slider(parent, "V", 0, 255, self.color_vars[color]["uv"], color)
+    def schedule_preview(self, color):
+        """Restart the color's preview timer, so dragging a slider redraws once it pauses instead of on every tick."""
+        if color in self.pending_previews:
+            self.root.after_cancel(self.pending_previews[color])
+        self.pending_previews[color] = self.root.after(PREVIEW_DELAY_MS, self.update_preview, color)
     def update_preview(self, color):
+        self.pending_previews.pop(color, None)
         vars = self.color_vars[color]
         lower = np.array([vars["lh"].get(), vars["ls"].get(), vars["lv"].get()])
         upper = np.array([vars["uh"].get(), vars["us"].get(), vars["uv"].get()])
-        hsv = cv2.cvtColor(self.orig_image, cv2.COLOR_BGR2HSV)
-        mask = cv2.inRange(hsv, lower, upper)
-        result = cv2.bitwise_and(self.orig_image, self.orig_image, mask=mask)
-        result_rgb = cv2.cvtColor(result, cv2.COLOR_BGR2RGB)
-        im_pil = Image.fromarray(result_rgb).resize(self.preview_size)
+        mask = cv2.inRange(self.preview_hsv, lower, upper)
+        result_rgb = cv2.bitwise_and(self.preview_rgb, self.preview_rgb, mask=mask)
+        im_pil = Image.fromarray(result_rgb)
         photo = ImageTk.PhotoImage(im_pil)
         if color in self.preview_labels:
             self.preview_labels[color].configure(image=photo)
@@ -43,6 +43,17 @@ class ColorCalibrationUI:
         self.mask_display = None
         self.hsv_frame = None
         
+        # Mask caches: inRange result of every saved range (keyed by its HSV bounds) and the OR of all
+        # saved ranges of every color. Slider moves only recompute the current range mask.
+        self.range_masks = {}
+        self.all_ranges_masks = {}
+        
+        # Preallocated display buffers (RGB, current range | all saved ranges), set up in load_frame
+        self.original_rgb = None
+        self.combined_frame = None
+        self.mask_buffer = None
+        self.all_ranges_color = None
+        
         # Define default color ranges based on the original code
         self.colors = {
             'yellow': ColorRange('Yellow', (18, 50, 50), (35, 255, 255)),
@@ -222,6 +233,7 @@ class ColorCalibrationUI:
         
         # Add to ranges
         self.colors[self.current_color].add_current_range()
+        self.invalidate_saved_masks(self.current_color)
         
         # Update the display
         self.update_range_list()
@@ -233,6 +245,7 @@ class ColorCalibrationUI:
         if selected:
             index = selected[0]
             self.colors[self.current_color].remove_range(index)
+            self.invalidate_saved_masks(self.current_color)
             self.update_range_list()
             self.update_mask()
     
@@ -266,6 +279,33 @@ class ColorCalibrationUI:
             max_vals = range_values['max']
             self.range_listbox.insert(tk.END, f"Range {i+1}: H({min_vals[0]}-{max_vals[0]}) S({min_vals[1]}-{max_vals[1]}) V({min_vals[2]}-{max_vals[2]})")
     
+    def invalidate_saved_masks(self, color):
+        """Drop the cached all saved ranges mask of a color after its range list changed"""
+        self.all_ranges_masks.pop(color, None)
+        self.all_ranges_color = None
+    
+    def range_mask(self, min_hsv, max_hsv):
+        """inRange mask of one saved range, computed once per distinct range"""
+        key = (tuple(min_hsv), tuple(max_hsv))
+        if key not in self.range_masks:
+            self.range_masks[key] = cv2.inRange(self.hsv_frame, np.array(min_hsv), np.array(max_hsv))
+        return self.range_masks[key]
+    
+    def all_ranges_mask(self, color):
+        """OR of the masks of all saved ranges of a color, rebuilt only after the range list changed"""
+        if color not in self.all_ranges_masks:
+            combined = np.zeros(self.hsv_frame.shape[:2], dtype=np.uint8)
+            for range_values in self.colors[color].ranges:
+                cv2.bitwise_or(combined, self.range_mask(range_values['min'], range_values['max']), dst=combined)
+            self.all_ranges_masks[color] = combined
+        return self.all_ranges_masks[color]
+    
+    def draw_masked(self, dst, mask, label):
+        """Draw the masked frame and its label into a half of the combined display buffer"""
+        dst.fill(0)
+        cv2.bitwise_and(self.original_rgb, self.original_rgb, mask=mask, dst=dst)
+        cv2.putText(dst, label, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+    
     def update_mask(self, *args):
         """Update the color mask based on current HSV values"""
         if self.hsv_frame is None:
@@ -287,34 +327,17 @@ class ColorCalibrationUI:
         current_mask = cv2.inRange(
             self.hsv_frame,
             np.array(self.colors[self.current_color].min_hsv),
-            np.array(self.colors[self.current_color].max_hsv)
+            np.array(self.colors[self.current_color].max_hsv),
+            dst=self.mask_buffer
         )
         
-        # Create mask for all saved ranges
-        all_ranges_mask = np.zeros_like(current_mask)
-        for range_values in self.colors[self.current_color].ranges:
-            min_hsv = np.array(range_values['min'])
-            max_hsv = np.array(range_values['max'])
-            range_mask = cv2.inRange(self.hsv_frame, min_hsv, max_hsv)
-            all_ranges_mask = cv2.bitwise_or(all_ranges_mask, range_mask)
-        
-        # Apply mask to original frame for visualization
-        masked_frame = cv2.bitwise_and(self.original_frame, self.original_frame, mask=current_mask)
-        all_ranges_frame = cv2.bitwise_and(self.original_frame, self.original_frame, mask=all_ranges_mask)
-        
-        # Combine the two visualizations side by side
-        h, w = masked_frame.shape[:2]
-        combined_mask = np.zeros((h, w*2, 3), dtype=np.uint8)
-        combined_mask[:, :w] = masked_frame
-        combined_mask[:, w:] = all_ranges_frame
-        
-        # Add labels
-        cv2.putText(combined_mask, "Current Range", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        cv2.putText(combined_mask, "All Saved Ranges", (w+10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-        
-        # Update mask display
-        combined_mask_rgb = cv2.cvtColor(combined_mask, cv2.COLOR_BGR2RGB)
-        self.mask_display = Image.fromarray(combined_mask_rgb)
+        # Draw both visualizations side by side into the preallocated buffer, the all saved ranges half
+        # only changes with the range list or the selected color
+        h, w = current_mask.shape[:2]
+        self.draw_masked(self.combined_frame[:, :w], current_mask, "Current Range")
+        if self.all_ranges_color != self.current_color:
+            self.draw_masked(self.combined_frame[:, w:], self.all_ranges_mask(self.current_color), "All Saved Ranges")
+            self.all_ranges_color = self.current_color
         
         # Resize for display while maintaining aspect ratio
         mask_width = self.mask_canvas.winfo_width()
@@ -333,9 +356,15 @@ class ColorCalibrationUI:
                 new_height = mask_height
                 new_width = int(new_height * mask_aspect)
             
-            self.mask_display = self.mask_display.resize((new_width, new_height), Image.LANCZOS)
-        
-        mask_tk = ImageTk.PhotoImage(self.mask_display)
+            # The display buffer is reused while the canvas keeps its size
+            if self.mask_display is None or self.mask_display.shape[:2] != (new_height, new_width):
+                self.mask_display = np.empty((new_height, new_width, 3), dtype=np.uint8)
+            cv2.resize(self.combined_frame, (new_width, new_height), dst=self.mask_display, interpolation=cv2.INTER_AREA)
+            display = Image.fromarray(self.mask_display)
+        else:
+            display = Image.fromarray(self.combined_frame)
+        
+        mask_tk = ImageTk.PhotoImage(display)
         self.mask_canvas.config(width=mask_tk.width(), height=mask_tk.height())
         self.mask_canvas.create_image(0, 0, anchor=tk.NW, image=mask_tk)
         self.mask_canvas.image = mask_tk  # Keep reference
@@ -389,8 +418,17 @@ class ColorCalibrationUI:
             self.original_frame = frame
             self.hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
             
+            # Cached masks belong to the previous frame
+            self.range_masks.clear()
+            self.all_ranges_masks.clear()
+            self.all_ranges_color = None
+            
             # Convert for display
             frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            self.original_rgb = frame_rgb
+            h, w = frame.shape[:2]
+            self.combined_frame = np.zeros((h, w*2, 3), dtype=np.uint8)
+            self.mask_buffer = np.empty((h, w), dtype=np.uint8)
             self.display_frame = Image.fromarray(frame_rgb)
             
             # Resize to fit canvas